@@ -0,0 +1,88 @@
+# benchmarks/filter_bench.py
+"""Micro-benchmark of the compiled URLFilter against the previous multi-pass filtering.
+
+    python benchmarks/filter_bench.py --rows 10000000
+"""
+import argparse
+import os
+import sys
+import time
+from urllib.parse import unquote, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.filters import URLFilter
+from core.records import URLResult
+from synthetic import synthetic_results
+
+# ;params on the last path segment, which urlparse splits off before the extension check
+EXTRA_URLS = [
+    'https://example.com/api/login.php;jsessionid=ABC',
+    'https://example.com/admin/app.js;v=2?user=1',
+    'https://example.com/user;type=a/index.html',
+    'https://example.com/api/item.php;x/detail',
+    'https://example.com/user/dump.bak;jsessionid=ABC',
+]
+
+def corpus(rows):
+    return synthetic_results(rows) + [URLResult(url=url, source='wayback') for url in EXTRA_URLS]
+
+def legacy_filter(url_results, min_length, filter_ext, exclude_ext, filter_patterns, exclude_patterns):
+    """The filtering pipeline as it was before URLFilter compiled it into one predicate"""
+    unique = set()
+    filtered = []
+    for result in url_results:
+        url = unquote(result.url).strip()
+        parsed = urlparse(url)
+        if not url or parsed.scheme not in ('http', 'https') or len(url) < min_length:
+            continue
+        if filter_ext and not any(parsed.path.lower().endswith(f".{ext}") for ext in filter_ext):
+            continue
+        if filter_patterns and not any(pat in url for pat in filter_patterns):
+            continue
+        if exclude_patterns and any(pat in url for pat in exclude_patterns):
+            continue
+        if url not in unique:
+            unique.add(url)
+            result.url = url
+            filtered.append(result)
+    if exclude_ext:
+        filtered = [res for res in filtered if not any(urlparse(res.url).path.lower().endswith(f".{ext}") for ext in exclude_ext)]
+    seen = set()
+    deduped = []
+    for result in filtered:
+        if result.url not in seen:
+            seen.add(result.url)
+            deduped.append(result)
+    return deduped
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark URLFilter against the legacy filtering passes")
+    parser.add_argument('--rows', type=int, default=1000000, help='Synthetic URLs to filter (default 1000000)')
+    args = parser.parse_args()
+
+    options = dict(min_length=10, filter_ext=['js', 'php', 'json', 'html'], exclude_ext=['bak'],
+                   filter_patterns=['api', 'admin', 'user'], exclude_patterns=['logout', 'static'])
+
+    results = corpus(args.rows)
+    start = time.perf_counter()
+    legacy = legacy_filter(results, **options)
+    legacy_time = time.perf_counter() - start
+
+    results = corpus(args.rows)
+    url_filter = URLFilter(allowed_schemes=('http', 'https'), min_length=options['min_length'],
+                           extensions=options['filter_ext'], exclude_extensions=options['exclude_ext'],
+                           include=options['filter_patterns'], exclude=options['exclude_patterns'])
+    start = time.perf_counter()
+    compiled = url_filter.filter_urls(results)
+    compiled_time = time.perf_counter() - start
+
+    assert [r.url for r in legacy] == [r.url for r in compiled], "compiled filter disagrees with legacy filter"
+    print(f"rows:     {args.rows}")
+    print(f"kept:     {len(compiled)}")
+    print(f"legacy:   {legacy_time:.2f}s ({args.rows / legacy_time:,.0f} rows/s)")
+    print(f"compiled: {compiled_time:.2f}s ({args.rows / compiled_time:,.0f} rows/s)")
+    print(f"speedup:  {legacy_time / compiled_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
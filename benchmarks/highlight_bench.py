@@ -0,0 +1,81 @@
+# benchmarks/highlight_bench.py
+"""Recon highlights from the combined regex checked and timed against the previous per-pattern search.
+
+Extra rules that overlap the built-in categories make sure every matching
+category is still reported for a URL, not just the first.
+
+    python benchmarks/highlight_bench.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.analyzer import URLAnalyzer
+from core.records import URLResult
+from synthetic import synthetic_results
+
+# Each overlaps a built-in category on some URLs
+OVERLAPPING_RULES = {
+    'Token Leak': ['/admin/.*token', r'[?&](?:id|token)='],
+    'Config Access': [r'/config\b', r'\.sql$'],
+    'Versioned API': [r'/api/v1\b'],
+    # Global flags and backreferences cannot be joined into the combined regex
+    'Secrets': [r'(?i)/secret', r'/(\w)\1+\.php'],
+}
+
+EXTRA_URLS = [
+    'https://x.com/admin/reset?token=1',
+    'https://x.com/config/backup.sql',
+    'https://x.com/api/v1/users',
+    'https://x.com/uploads/.env',
+    'https://x.com/api/Secret/aa.php',
+]
+
+def legacy_highlights(analyzer: URLAnalyzer, url_results):
+    """Highlights as they were found before the rules were compiled: one search per pattern"""
+    highlights = []
+    for result in url_results:
+        for label, patterns in analyzer.suspicious_patterns.items():
+            for pattern in patterns:
+                if re.search(pattern, result.url, re.IGNORECASE):
+                    highlights.append({'url': result.url, 'type': label})
+                    break
+    return highlights
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark recon highlights against the per-pattern search")
+    parser.add_argument('--rows', type=int, default=1000000, help='Synthetic URLs to scan (default 1000000)')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(OVERLAPPING_RULES, f)
+    try:
+        analyzer = URLAnalyzer(rules_files=[f.name])
+    finally:
+        os.remove(f.name)
+
+    results = synthetic_results(args.rows) + [URLResult(url=url, source='wayback') for url in EXTRA_URLS]
+
+    start = time.perf_counter()
+    legacy = legacy_highlights(analyzer, results)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = analyzer.find_recon_highlights(results)
+    compiled_time = time.perf_counter() - start
+
+    assert legacy == compiled, "combined highlight regex disagrees with the per-pattern search"
+    print(f"rows:       {len(results)}")
+    print(f"highlights: {len(compiled)}")
+    print(f"legacy:     {legacy_time:.2f}s ({len(results) / legacy_time:,.0f} rows/s)")
+    print(f"compiled:   {compiled_time:.2f}s ({len(results) / compiled_time:,.0f} rows/s)")
+    print(f"speedup:    {legacy_time / compiled_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
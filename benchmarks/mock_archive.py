@@ -0,0 +1,175 @@
+# benchmarks/mock_archive.py
+"""Local stand-in for the Wayback CDX API, the Common Crawl index server and VirusTotal.
+
+Responses are synthetic but shaped like the real ones, with configurable
+sizes, per-request latency and an error rate (503/429 with Retry-After).
+
+    python benchmarks/mock_archive.py --port 8765 --pages 20 --rows-per-page 50000
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+
+from aiohttp import web
+
+from synthetic import synthetic_timestamp, synthetic_url
+
+@dataclass
+class MockConfig:
+    pages: int = 10                 # CDX pages per query
+    rows_per_page: int = 10000
+    cc_indexes: int = 2
+    cc_pages: int = 5               # pages per Common Crawl index
+    vt_rows: int = 1000
+    latency: float = 0.0            # seconds added to every response
+    error_rate: float = 0.0         # share of page requests answered with 503/429
+    seed: int = 1
+
+class MockArchive:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests = 0
+        self.errors = 0
+
+    async def _delay_or_fail(self, page_request: bool):
+        self.requests += 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        if page_request and self.config.error_rate and self.rng.random() < self.config.error_rate:
+            self.errors += 1
+            status = self.rng.choice((429, 503))
+            return web.Response(status=status, text='busy', headers={'Retry-After': '0'})
+        return None
+
+    @staticmethod
+    def _cdx_filters(query):
+        """CDX filter= values as (negate, field, compiled regex); like the real server, a row must match fully"""
+        filters = []
+        for value in query.getall('filter', []):
+            negate = value.startswith('!')
+            field, _, pattern = value.lstrip('!').partition(':')
+            filters.append((negate, field, re.compile(pattern)))
+        return filters
+
+    def _rows(self, key: str, page: int, count: int):
+        rng = random.Random(f"{self.config.seed}:{key}:{page}")
+        first = page * count
+        for i in range(first, first + count):
+            yield synthetic_url(rng, i), synthetic_timestamp(rng)
+
+    async def cdx(self, request: web.Request) -> web.StreamResponse:
+        query = request.query
+        if query.get('showNumPages'):
+            failure = await self._delay_or_fail(False)
+            return failure or web.Response(text=f"{self.config.pages}\n")
+        failure = await self._delay_or_fail(True)
+        if failure:
+            return failure
+        page = int(query.get('page', 0))
+        fields = query.get('fl', '').split(',') if query.get('fl') else None
+        filters = self._cdx_filters(query)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        chunk = []
+        for url, timestamp in self._rows('cdx', page, self.config.rows_per_page):
+            row = {'urlkey': url.split('://', 1)[-1], 'timestamp': timestamp, 'original': url,
+                   'mimetype': 'text/html', 'statuscode': '200', 'digest': 'D', 'length': '100'}
+            if any(bool(regex.fullmatch(row[field])) == negate for negate, field, regex in filters):
+                continue
+            chunk.append(' '.join(row[field] for field in fields) if fields else ' '.join(row.values()))
+            if len(chunk) >= 1000:
+                await response.write(('\n'.join(chunk) + '\n').encode())
+                chunk = []
+        if chunk:
+            await response.write(('\n'.join(chunk) + '\n').encode())
+        await response.write_eof()
+        return response
+
+    async def collinfo(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail(False)
+        base = f"http://{request.host}"
+        collections = [{'id': f"CC-MAIN-{2024 - index}-10", 'name': f"Mock crawl {index}",
+                        'cdx-api': f"{base}/CC-MAIN-{2024 - index}-10-index"}
+                       for index in range(self.config.cc_indexes)]
+        return web.json_response(collections)
+
+    async def cc_index(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info['name']
+        query = request.query
+        if query.get('showNumPages'):
+            failure = await self._delay_or_fail(False)
+            return failure or web.json_response({'pages': self.config.cc_pages, 'pageSize': 5, 'blocks': 1})
+        failure = await self._delay_or_fail(True)
+        if failure:
+            return failure
+        page = int(query.get('page', 0))
+        fields = query.get('fl', '').split(',') if query.get('fl') else None
+        response = web.StreamResponse()
+        await response.prepare(request)
+        chunk = []
+        for url, timestamp in self._rows(name, page, self.config.rows_per_page):
+            row = {'urlkey': url, 'timestamp': timestamp, 'url': url, 'mime': 'text/html', 'status': '200',
+                   'digest': 'D', 'length': '100', 'offset': '0', 'filename': f"crawl-data/{name}/segment.warc.gz"}
+            chunk.append(json.dumps({field: row[field] for field in fields} if fields else row))
+            if len(chunk) >= 1000:
+                await response.write(('\n'.join(chunk) + '\n').encode())
+                chunk = []
+        if chunk:
+            await response.write(('\n'.join(chunk) + '\n').encode())
+        await response.write_eof()
+        return response
+
+    async def virustotal(self, request: web.Request) -> web.Response:
+        failure = await self._delay_or_fail(True)
+        if failure:
+            return failure
+        urls = [{'url': url, 'positives': 1} for url, _ in self._rows('vt', 0, self.config.vt_rows)]
+        return web.json_response({'detected_urls': urls})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/cdx/search/cdx', self.cdx)
+        app.router.add_get('/collinfo.json', self.collinfo)
+        app.router.add_get('/vtapi/v2/domain/report', self.virustotal)
+        app.router.add_get('/{name}-index', self.cc_index)
+        return app
+
+def point_harvester_at(base_url: str):
+    """Send every URLHarvester request to the mock server at base_url"""
+    import core.harvester as harvester
+    harvester.WAYBACK_CDX_URL = f"{base_url}/cdx/search/cdx"
+    harvester.COMMONCRAWL_INDEX_URL = base_url
+    harvester.VIRUSTOTAL_REPORT_URL = f"{base_url}/vtapi/v2/domain/report"
+
+async def start_server(config: MockConfig, host: str = '127.0.0.1', port: int = 0):
+    """Start the mock in the running loop; returns (runner, base_url)"""
+    runner = web.AppRunner(MockArchive(config).app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic archive responses for offline benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=10, help='CDX pages per query')
+    parser.add_argument('--rows-per-page', type=int, default=10000)
+    parser.add_argument('--cc-indexes', type=int, default=2)
+    parser.add_argument('--cc-pages', type=int, default=5)
+    parser.add_argument('--vt-rows', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of page requests that fail with 503/429')
+    args = parser.parse_args()
+    config = MockConfig(pages=args.pages, rows_per_page=args.rows_per_page, cc_indexes=args.cc_indexes,
+                        cc_pages=args.cc_pages, vt_rows=args.vt_rows, latency=args.latency,
+                        error_rate=args.error_rate)
+    web.run_app(MockArchive(config).app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# benchmarks/run.py
+"""Offline benchmark suite: throughput and peak memory per pipeline stage.
+
+Every stage runs in a fresh process so its peak RSS is its own. The harvest
+stage drives URLHarvester against the local mock archive; the other stages
+run on synthetic rows.
+
+    python benchmarks/run.py --rows 1000000 --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --rows 1000000 --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.metrics import peak_rss_bytes
+from synthetic import synthetic_batch, synthetic_results
+
+EXPORT_FORMATS = ('txt', 'csv', 'json', 'jsonl', 'html', 'store')
+STAGES = ('startup', 'harvest', 'clean_and_filter_urls', 'url_filter', 'cluster', 'recon_highlights', 'analyze') + \
+    tuple(f"export_{fmt}" for fmt in EXPORT_FORMATS)
+
+FILTER_OPTIONS = dict(min_length=10, extensions=['js', 'php', 'json', 'html'], exclude_extensions=['bak'],
+                      include=['api', 'admin', 'user'], exclude=['logout', 'static'])
+
+def _harvest(rows: int, options: dict) -> int:
+    from mock_archive import MockConfig, point_harvester_at, start_server
+    from core.harvester import URLHarvester
+    from core.ratelimit import RateLimiter
+    from core.scheduler import HarvestScheduler
+
+    rows_per_page = min(rows, 10000)
+    # Half of the rows from Wayback, the rest split over two Common Crawl indexes
+    config = MockConfig(pages=max(1, rows // 2 // rows_per_page), rows_per_page=rows_per_page, cc_indexes=2,
+                        cc_pages=max(1, rows // 4 // rows_per_page), vt_rows=1000,
+                        latency=options['latency'], error_rate=options['error_rate'])
+    os.environ.setdefault('VT_API_KEY', 'benchmark')
+
+    async def run():
+        runner, base_url = await start_server(config)
+        point_harvester_at(base_url)
+        try:
+            # No cache and no rate limit: the point is to measure the client
+            async with URLHarvester(page_concurrency=options['page_concurrency'], page_retries=5,
+                                    rate_limiter=RateLimiter(rate=1e9, max_concurrency=64)) as harvester:
+                batch = await HarvestScheduler(harvester).collect(['example.com'])
+                return len(batch)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+def _startup(runs: int = 5) -> float:
+    """Median wall time of a --pipe invocation that has nothing to do, as xargs/parallel would pay per call"""
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pybackurls.py')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--pipe'], input=b'', stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def _prepare(stage: str, rows: int):
+    if stage == 'clean_and_filter_urls':
+        return synthetic_results(rows)
+    if stage not in ('harvest', 'startup'):
+        return synthetic_batch(rows)
+    return None
+
+def _run_stage(stage: str, data, rows: int, options: dict, workdir: str) -> int:
+    """Run one stage on prepared data; returns the number of rows it processed"""
+    if stage == 'harvest':
+        return _harvest(rows, options)
+    if stage == 'clean_and_filter_urls':
+        from pybackurls import clean_and_filter_urls
+        clean_and_filter_urls(data, min_length=FILTER_OPTIONS['min_length'],
+                              filter_ext=FILTER_OPTIONS['extensions'],
+                              filter_patterns=FILTER_OPTIONS['include'],
+                              exclude_patterns=FILTER_OPTIONS['exclude'])
+        return len(data)
+    if stage == 'url_filter':
+        from core.filters import URLFilter
+        URLFilter(allowed_schemes=('http', 'https'), **FILTER_OPTIONS).filter_batch(data)
+        return len(data)
+    if stage == 'cluster':
+        from core.clustering import URLClusterer
+        URLClusterer().cluster_batch(data)
+        return len(data)
+    if stage == 'recon_highlights':
+        from core.analyzer import URLAnalyzer
+        URLAnalyzer().find_recon_highlights(data)
+        return len(data)
+    if stage == 'analyze':
+        from core.analyzer import URLAnalyzer
+        URLAnalyzer().analyze_urls(data, workers=1)
+        return len(data)
+    if stage.startswith('export_'):
+        from core.exporters import URLExporter
+        fmt = stage[len('export_'):]
+        exporter = URLExporter(compress=options['compress'])
+        filename = os.path.join(workdir, f"bench.{fmt}")
+        if fmt == 'json':
+            exporter.export_json(data, filename, include_stats=False)
+        else:
+            getattr(exporter, f"export_{fmt}")(data, filename)
+        return len(data)
+    raise ValueError(f"Unknown stage: {stage}")
+
+def measure(stage: str, rows: int, options: dict) -> dict:
+    """Child-process entry point: prepare input, then time the stage and record its memory"""
+    if stage == 'startup':
+        seconds = _startup()
+        # One "row" per start, so rows/s reads as starts per second
+        return {'rows': 1, 'seconds': round(seconds, 4), 'rows_per_second': round(1 / seconds, 1),
+                'peak_rss_mb': 0.0, 'stage_memory_mb': 0.0}
+    data = _prepare(stage, rows)
+    before = peak_rss_bytes() or 0
+    with tempfile.TemporaryDirectory(prefix='pybackurls-bench-') as workdir:
+        start = time.perf_counter()
+        processed = _run_stage(stage, data, rows, options, workdir)
+        seconds = time.perf_counter() - start
+    peak = peak_rss_bytes() or 0
+    return {
+        'rows': processed,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(processed / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(peak / 1048576, 1),
+        # Growth of the peak over what the prepared input already needed
+        'stage_memory_mb': round(max(peak - before, 0) / 1048576, 1),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Stages whose throughput fell, or whose peak memory grew, by more than tolerance"""
+    regressions = []
+    for stage, result in results.items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            continue
+        if base.get('rows_per_second') and result['rows_per_second'] is not None and \
+                result['rows_per_second'] < base['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{stage}: {result['rows_per_second']:,.0f} rows/s vs baseline "
+                               f"{base['rows_per_second']:,.0f}")
+        if base.get('peak_rss_mb') and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{stage}: peak RSS {result['peak_rss_mb']} MB vs baseline {base['peak_rss_mb']} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage offline")
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows per stage (default 1000000)')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run (default: all)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mock archive latency per response in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of mock page requests that fail')
+    parser.add_argument('--page-concurrency', type=int, default=4, help='Harvester page concurrency')
+    parser.add_argument('--compress', choices=('gzip', 'zstd'), help='Compress exporter output')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--save-baseline', help='Write the results as a new baseline file')
+    parser.add_argument('--baseline', help='Compare against this baseline file and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed throughput drop or memory growth before a regression is reported (default 0.15)')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    options = {'latency': args.latency, 'error_rate': args.error_rate,
+               'page_concurrency': args.page_concurrency, 'compress': args.compress}
+
+    results = {}
+    print(f"{'stage':<24}{'rows':>12}{'seconds':>10}{'rows/s':>14}{'peak MB':>10}{'stage MB':>10}")
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(measure, stage, args.rows, options).result()
+        results[stage] = result
+        print(f"{stage:<24}{result['rows']:>12,}{result['seconds']:>10.2f}{result['rows_per_second'] or 0:>14,.0f}"
+              f"{result['peak_rss_mb']:>10.1f}{result['stage_memory_mb']:>10.1f}")
+
+    report = {'rows': args.rows, 'python': sys.version.split()[0], 'stages': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('rows') != args.rows:
+            print(f"\n[!] Baseline was recorded with {baseline.get('rows')} rows, this run used {args.rows}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
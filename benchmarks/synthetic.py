@@ -0,0 +1,38 @@
+# benchmarks/synthetic.py
+"""Deterministic synthetic URLs shared by the benchmarks and the mock archive server"""
+import random
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.records import URLBatch, URLResult, source_id
+
+EXTENSIONS = ['js', 'php', 'html', 'json', 'png', 'css', 'txt', 'bak', 'sql', '']
+WORDS = ['admin', 'api', 'v1', 'static', 'user', 'login', 'logout', 'search', 'img', 'docs', 'config', 'uploads']
+
+def synthetic_url(rng: random.Random, i: int, domain: str = 'example.com') -> str:
+    path = '/'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    ext = rng.choice(EXTENSIONS)
+    url = f"{rng.choice(['http', 'https'])}://sub{i % 97}.{domain}/{path}/{i}{'.' + ext if ext else ''}"
+    if rng.random() < 0.3:
+        url += f"?id={i}&q=a%20b"
+    return url
+
+def synthetic_timestamp(rng: random.Random) -> str:
+    return f"20{rng.randint(10, 23)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}000000"
+
+def synthetic_results(rows, seed=1):
+    rng = random.Random(seed)
+    return [URLResult(url=synthetic_url(rng, i), source='wayback', timestamp=synthetic_timestamp(rng))
+            for i in range(rows)]
+
+def synthetic_batch(rows, seed=1) -> URLBatch:
+    """The same rows as synthetic_results, built straight into columns"""
+    rng = random.Random(seed)
+    batch = URLBatch()
+    wayback = source_id('wayback')
+    for i in range(rows):
+        url = synthetic_url(rng, i)
+        batch.append_row(url, wayback, int(synthetic_timestamp(rng)))
+    return batch
@@ -1,14 +1,144 @@
 # core/analyzer.py
 
+import json
+import os
 import re
 from collections import Counter
-from urllib.parse import urlparse, parse_qs
-from typing import List, Dict, Set
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+from typing import List, Dict, Optional, Set, Tuple
 
-class URLAnalyzer:
+from .records import URLBatch, iter_urls, source_name
+from .urls import split_url, strip_params
+
+# Inputs smaller than this are analysed in-process; pickling shards costs more than it saves
+PARALLEL_THRESHOLD = 1000000
+
+# Backreferences, which point at other groups once patterns are joined into one alternation
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+def _any_search(patterns: List[str], guard: str = ''):
+    """search function finding any of patterns (case-insensitive), or None if there are none.
+
+    Patterns are joined into one alternation where that keeps their meaning.
+    Ones with global inline flags or backreferences are searched on their own,
+    and so is every pattern if the alternation fails to compile, e.g. over a
+    named group used by two of them.
+    """
+    plain_flags = re.compile('', re.IGNORECASE).flags
+    joinable, alone = [], []
+    for pattern in patterns:
+        compiled = re.compile(pattern, re.IGNORECASE)
+        if compiled.flags != plain_flags or (compiled.groups and _BACKREFERENCE.search(pattern)):
+            alone.append(compiled)
+        else:
+            joinable.append(pattern)
+    regexes = []
+    if joinable:
+        try:
+            regexes.append(re.compile(guard + '(?:' + '|'.join(f'(?:{pattern})' for pattern in joinable) + ')',
+                                      re.IGNORECASE))
+        except re.error:
+            regexes.extend(re.compile(pattern, re.IGNORECASE) for pattern in joinable)
+    regexes.extend(alone)
+    if not regexes:
+        return None
+    if len(regexes) == 1:
+        return regexes[0].search
+    return lambda text: any(regex.search(text) for regex in regexes)
+
+def _param_names(query: str) -> Set[str]:
+    """Names of the non-blank query parameters, as parse_qs would report them"""
+    names = set()
+    for pair in query.split('&'):
+        name, _, value = pair.partition('=')
+        if name and value:
+            names.add(unquote(name.replace('+', ' ')))
+    return names
+
+class URLStats:
+    """Partial statistics over a slice of URLs; partials from several workers merge into one"""
 
     def __init__(self):
+        self.total_urls = 0
+        self.domains: Set[str] = set()
+        self.extensions = Counter()
+        self.parameters = Counter()
+        self.sources = Counter()
+        self.earliest = 0
+        self.latest = 0
+
+    def add(self, url: str, source: str, timestamp: int):
+        """Parse the URL once and update every statistic from it"""
+        self.total_urls += 1
+        self.sources[source] += 1
+        scheme, netloc, path, query = split_url(url)
+        self.domains.add((netloc or '').lower())
+        path = strip_params(path)
+        if '.' in path:
+            ext = path.rsplit('.', 1)[1].lower()
+            if len(ext) <= 5:
+                self.extensions[ext] += 1
+        if query:
+            self.parameters.update(_param_names(query))
+        if timestamp:
+            if not self.earliest or timestamp < self.earliest:
+                self.earliest = timestamp
+            if timestamp > self.latest:
+                self.latest = timestamp
+
+    def merge(self, other: 'URLStats'):
+        self.total_urls += other.total_urls
+        self.domains |= other.domains
+        self.extensions.update(other.extensions)
+        self.parameters.update(other.parameters)
+        self.sources.update(other.sources)
+        if other.earliest and (not self.earliest or other.earliest < self.earliest):
+            self.earliest = other.earliest
+        self.latest = max(self.latest, other.latest)
+
+    @staticmethod
+    def _format_date(timestamp: int) -> str:
+        day = str(timestamp)[:8]
+        return f"{day[:4]}-{day[4:6]}-{day[6:8]}"
+
+    def as_dict(self) -> Dict:
+        if self.earliest:
+            date_range = {'earliest': self._format_date(self.earliest), 'latest': self._format_date(self.latest)}
+        else:
+            date_range = {'earliest': 'N/A', 'latest': 'N/A'}
+        return {
+            'total_urls': self.total_urls,
+            'unique_domains': len(self.domains),
+            'file_extensions': dict(self.extensions.most_common(10)),
+            'parameters_found': dict(self.parameters.most_common(10)),
+            'date_range': date_range,
+            'source_distribution': dict(self.sources),
+        }
+
+def _columns(url_results) -> Tuple[List[str], List[str], List[int]]:
+    """url, source name and integer timestamp columns of a URLBatch or a list of results"""
+    if isinstance(url_results, URLBatch):
+        return (url_results.urls,
+                [source_name(source) for source in url_results.sources],
+                list(url_results.timestamps))
+    urls, sources, timestamps = [], [], []
+    for result in url_results:
+        urls.append(result.url)
+        sources.append(result.source)
+        timestamps.append(result.timestamp_value)
+    return urls, sources, timestamps
+
+def _analyze_shard(urls: List[str], sources: List[str], timestamps: List[int]) -> URLStats:
+    stats = URLStats()
+    add = stats.add
+    for url, source, timestamp in zip(urls, sources, timestamps):
+        add(url, source, timestamp)
+    return stats
+
+class URLAnalyzer:
+
+    def __init__(self, rules_files: Optional[List[str]] = None):
         self.suspicious_patterns = {
             'Admin Panel': [r'/admin\b', r'/administrator\b', r'/wp-admin\b', r'/phpmyadmin\b'],
             'Backup/Config File': [r'\.env$', r'\.config$', r'/config\.', r'\.ini$', r'\.bak$', r'\.backup$', r'\.old$', r'\.orig$', r'\.sql$', r'\.db$', r'\.sqlite'],
@@ -17,81 +147,78 @@ class URLAnalyzer:
             'API Endpoint': [r'/api/', r'/v1/', r'/v2/', r'/rest/'],
             'Upload Directory': [r'/uploads/', r'/files/', r'/documents/'],
         }
+        for path in rules_files or []:
+            self.load_rules(path)
+        self._compile_rules()
 
-    def analyze_urls(self, url_results: List) -> Dict:
-        """Comprehensive URL analysis"""
-        urls = [result.url for result in url_results]
-        stats = {
-            'total_urls': len(urls),
-            'unique_domains': len(self._extract_domains(urls)),
-            'file_extensions': self._analyze_extensions(urls),
-            'parameters_found': self._analyze_parameters(urls),
-            'date_range': self._analyze_date_range(url_results),
-            'source_distribution': self._analyze_sources(url_results),
-        }
-        return stats
-
-    def _extract_domains(self, urls: List[str]) -> Set[str]:
-        domains = set()
-        for url in urls:
-            try:
-                parsed = urlparse(url)
-                domains.add(parsed.netloc.lower())
-            except:
-                continue
-        return domains
-
-    def _analyze_extensions(self, urls: List[str]) -> Dict[str, int]:
-        extensions = []
-        for url in urls:
-            try:
-                path = urlparse(url).path
-                if '.' in path:
-                    ext = path.split('.')[-1].lower()
-                    if len(ext) <= 5:
-                        extensions.append(ext)
-            except:
-                continue
-        return dict(Counter(extensions).most_common(10))
-
-    def _analyze_parameters(self, urls: List[str]) -> Dict[str, int]:
-        params = []
-        for url in urls:
-            try:
-                parsed = urlparse(url)
-                query_params = parse_qs(parsed.query)
-                params.extend(query_params.keys())
-            except:
-                continue
-        return dict(Counter(params).most_common(10))
+    def load_rules(self, path: str):
+        """Merge extra highlight rules from a JSON file of {"Category": ["regex", ...]}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict):
+            raise ValueError(f"Rules file {path} must contain an object of category -> pattern list")
+        for label, patterns in rules.items():
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            for pattern in patterns:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise ValueError(f"Invalid pattern {pattern!r} for {label!r} in {path}: {e}")
+            self.suspicious_patterns.setdefault(label, []).extend(patterns)
+        self._compile_rules()
 
-    def _analyze_date_range(self, url_results: List) -> Dict[str, str]:
-        timestamps = [result.timestamp for result in url_results if result.timestamp]
-        if not timestamps:
-            return {'earliest': 'N/A', 'latest': 'N/A'}
-        try:
-            dates = [datetime.strptime(ts[:8], '%Y%m%d') for ts in timestamps if len(ts) >= 8]
-            if dates:
-                return {
-                    'earliest': min(dates).strftime('%Y-%m-%d'),
-                    'latest': max(dates).strftime('%Y-%m-%d')
-                }
-        except:
-            pass
-        return {'earliest': 'N/A', 'latest': 'N/A'}
-
-    def _analyze_sources(self, url_results: List) -> Dict[str, int]:
-        sources = [result.source for result in url_results]
-        return dict(Counter(sources))
+    def _compile_rules(self):
+        """Compile the rules into one search per category, behind a single test for any match at all.
+
+        Most URLs match no rule and are dismissed by the combined test in one
+        scan; the rest are searched category by category, so every category
+        that matches is reported even where patterns of several overlap.
+        """
+        self._categories = [
+            (label, _any_search(patterns))
+            for label, patterns in self.suspicious_patterns.items()
+            if patterns
+        ]
+        # Every built-in rule starts at a '/' or '.', so positions on other characters can be skipped at once
+        patterns = [pattern for patterns in self.suspicious_patterns.values() for pattern in patterns]
+        guard = "(?=[/.])" if all(pattern.startswith(('/', r'\.')) for pattern in patterns) else ""
+        self._highlight_search = _any_search(patterns, guard)
+
+    def is_highlight(self, text: str) -> bool:
+        """True if any highlight rule matches text, a URL or part of one"""
+        return self._highlight_search is not None and bool(self._highlight_search(text))
+
+    def analyze_urls(self, url_results, workers: Optional[int] = None) -> Dict:
+        """Comprehensive URL analysis in one fused pass, sharded across processes for large inputs"""
+        urls, sources, timestamps = _columns(url_results)
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        if workers <= 1 or len(urls) < PARALLEL_THRESHOLD:
+            return _analyze_shard(urls, sources, timestamps).as_dict()
+
+        shard_size = -(-len(urls) // workers)
+        stats = URLStats()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shards = [
+                pool.submit(_analyze_shard, urls[start:start + shard_size],
+                            sources[start:start + shard_size], timestamps[start:start + shard_size])
+                for start in range(0, len(urls), shard_size)
+            ]
+            for shard in shards:
+                stats.merge(shard.result())
+        return stats.as_dict()
 
     def find_recon_highlights(self, url_results: List) -> List[Dict[str, str]]:
         """Finds and tags 'hot' recon discovery URLs."""
         highlights = []
-        for result in url_results:
-            url = result.url
-            for label, patterns in self.suspicious_patterns.items():
-                for pattern in patterns:
-                    if re.search(pattern, url, re.IGNORECASE):
-                        highlights.append({'url': url, 'type': label})
-                        break
+        search = self._highlight_search
+        if search is None:
+            return highlights
+        categories = self._categories
+        for url in iter_urls(url_results):
+            if not search(url):
+                continue
+            for label, category_search in categories:
+                if category_search(url):
+                    highlights.append({'url': url, 'type': label})
         return highlights
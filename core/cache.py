@@ -0,0 +1,172 @@
+# core/cache.py
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Iterator, Optional
+
+# Default time-to-live per source, in seconds. Common Crawl indexes never change
+# once published, archive snapshots keep growing so they expire sooner.
+DEFAULT_TTLS = {
+    'wayback': 24 * 3600,
+    'commoncrawl': 30 * 24 * 3600,
+    'commoncrawl-collinfo': 24 * 3600,
+    'virustotal': 24 * 3600,
+}
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pybackurls')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+class CacheRecorder:
+    """Compresses a response body as it streams past and stores it once complete.
+
+    A body whose compressed copy outgrows max_bytes is not cached at all, so
+    one huge unpaginated response never sits in memory twice.
+    """
+
+    def __init__(self, cache: 'ResponseCache', key: str, source: str, url: str, page: Optional[int],
+                 max_bytes: Optional[int] = None):
+        self.cache = cache
+        self.key = key
+        self.source = source
+        self.url = url
+        self.page = page
+        self.max_bytes = max_bytes
+        self._compressor = zlib.compressobj(6)
+        self._chunks = []
+        self._size = 0
+
+    def feed(self, data: bytes):
+        if self._compressor is None:
+            return
+        chunk = self._compressor.compress(data)
+        if chunk:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._compressor = None
+                self._chunks = []
+
+    def commit(self):
+        if self._compressor is None:
+            return
+        self._chunks.append(self._compressor.flush())
+        self.cache._store(self.key, self.source, self.url, self.page, b''.join(self._chunks))
+        self._chunks = []
+
+class NullRecorder:
+    """Recorder used when caching is disabled"""
+
+    def feed(self, data: bytes):
+        pass
+
+    def commit(self):
+        pass
+
+class ResponseCache:
+    """SQLite-backed store of compressed archive responses with per-source TTL and LRU eviction"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttls: Optional[Dict[str, int]] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, refresh: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'responses.db')
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, source TEXT, url TEXT, page INTEGER,"
+            " created REAL, accessed REAL, size INTEGER, body BLOB)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(source: str, url: str, page: Optional[int] = None) -> str:
+        return hashlib.sha256(f"{source}\0{url}\0{page}".encode()).hexdigest()
+
+    def get(self, source: str, url: str, page: Optional[int] = None) -> Optional[bytes]:
+        """Return the decompressed body if a fresh entry exists"""
+        blob = self._lookup(source, url, page)
+        return zlib.decompress(blob) if blob is not None else None
+
+    def iter_lines(self, source: str, url: str, page: Optional[int] = None) -> Optional[Iterator[bytes]]:
+        """Return an iterator over the cached body's lines, decompressed incrementally"""
+        blob = self._lookup(source, url, page)
+        if blob is None:
+            return None
+        return self._decompress_lines(blob)
+
+    def recorder(self, source: str, url: str, page: Optional[int] = None) -> CacheRecorder:
+        # An entry over a quarter of the cache would only evict most of the rest
+        return CacheRecorder(self, self.make_key(source, url, page), source, url, page, max_bytes=self.max_bytes // 4)
+
+    def put(self, source: str, url: str, body: bytes, page: Optional[int] = None):
+        self._store(self.make_key(source, url, page), source, url, page, zlib.compress(body, 6))
+
+    def close(self):
+        self.db.close()
+
+    def _lookup(self, source: str, url: str, page: Optional[int]) -> Optional[bytes]:
+        if self.refresh:
+            self.misses += 1
+            return None
+        key = self.make_key(source, url, page)
+        row = self.db.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[0] > self.ttls.get(source, DEFAULT_TTLS['wayback']):
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return row[1]
+
+    def _store(self, key: str, source: str, url: str, page: Optional[int], blob: bytes):
+        now = time.time()
+        old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if old:
+            self.total_bytes -= old[0]
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, source, url, page, created, accessed, size, body)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, source, url, page, now, now, len(blob), blob)
+        )
+        self.total_bytes += len(blob)
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its size cap"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed ASC")
+        doomed = []
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    @staticmethod
+    def _decompress_lines(blob: bytes, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj()
+        pending = b''
+        for offset in range(0, len(blob), chunk_size):
+            pending += decompressor.decompress(blob[offset:offset + chunk_size])
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        pending += decompressor.flush()
+        for line in pending.split(b'\n'):
+            if line:
+                yield line + b'\n'
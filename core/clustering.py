@@ -0,0 +1,238 @@
+# core/clustering.py
+import json
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .records import URLBatch
+from .urls import split_url
+
+# A whole segment that is a number, a UUID or a hex hash (16+ hex digits, at least one a digit), plus any extension
+_IDENTIFIER = re.compile(
+    r'(?:(\d+)'
+    r'|([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})'
+    r'|((?=[a-fA-F]*\d)[0-9a-fA-F]{16,}))'
+    r'(\.[A-Za-z0-9]{1,5})?'
+)
+_PLACEHOLDERS = (None, '{int}', '{uuid}', '{hash}')
+_HEX_START = frozenset('0123456789abcdefABCDEF')
+_EXTENSION = re.compile(r'[A-Za-z0-9]{1,5}')
+
+WILDCARD = '{*}'
+QUERY_VALUE = '{value}'
+
+def segment_template(segment: str) -> str:
+    """A path segment with numeric, UUID or hash identifiers replaced by a placeholder, keeping any extension"""
+    if segment[:1] not in _HEX_START:
+        return segment
+    match = _IDENTIFIER.fullmatch(segment)
+    if match is None:
+        return segment
+    placeholder = _PLACEHOLDERS[1 if match.group(1) else 2 if match.group(2) else 3]
+    return placeholder + match.group(4) if match.group(4) else placeholder
+
+def query_signature(query: Optional[str]) -> str:
+    """Parameter names in a canonical order with their values elided, so ?b=1&a=2 and ?a=3&b=4 match"""
+    if not query:
+        return ''
+    names = sorted({pair.partition('=')[0] for pair in query.split('&') if pair})
+    return '?' + '&'.join(f"{name}={QUERY_VALUE}" for name in names)
+
+class _Cluster:
+    __slots__ = ('count', 'representatives')
+
+    def __init__(self):
+        self.count = 0
+        self.representatives: List[str] = []
+
+class _Node:
+    """One directory level: subdirectories and the final segments of URLs ending here, kept apart"""
+    __slots__ = ('dirs', 'leaves', 'dir_literals', 'leaf_literals', 'dirs_collapsed', 'leaves_collapsed')
+
+    def __init__(self):
+        self.dirs: Dict[str, '_Node'] = {}
+        self.leaves: Dict[str, Dict[str, _Cluster]] = {}
+        self.dir_literals = 0
+        self.leaf_literals = 0
+        self.dirs_collapsed = False
+        self.leaves_collapsed = False
+
+def leaf_wildcard(segment: str) -> str:
+    """The wildcard a literal final segment collapses into; its extension stays, so backup.sql becomes {*}.sql"""
+    stem, dot, extension = segment.rpartition('.')
+    if dot and _EXTENSION.fullmatch(extension):
+        return f"{WILDCARD}.{extension.lower()}"
+    return WILDCARD
+
+class URLClusterer:
+    """Collapses URLs that differ only in IDs and parameter values into templates.
+
+    Each host gets a trie of templated path segments. Numeric, UUID and hash
+    segments become placeholders up front. A level that grows more than
+    max_children distinct literal directories (slugs, usernames) merges them
+    into one {*} directory; final segments are counted separately and collapse
+    into {*} plus their extension. Segments that `protect` flags, such as those
+    matching a recon highlight rule, always stay literal. Every leaf keeps a
+    count per query signature and the first `keep` URLs seen for it, which are
+    the ones add() lets through.
+    """
+
+    def __init__(self, keep: int = 1, max_children: int = 50, protect: Optional[Callable[[str], bool]] = None):
+        self.keep = max(1, keep)
+        self.max_children = max(1, max_children)
+        # Called with '/segment/' for directories and '/segment' for final segments
+        self.protect = protect
+        self.hosts: Dict[str, _Node] = {}
+        self.urls = 0
+        self.kept = 0
+
+    def add(self, url: str) -> bool:
+        """Count url in its template; True if it is one of the representatives to keep"""
+        scheme, host, path, query = split_url(url)
+        host = (host or '').lower()
+        node = self.hosts.get(host)
+        if node is None:
+            node = self.hosts[host] = _Node()
+        segments = path.split('/')[1:] or ['']
+        for segment in segments[:-1]:
+            node = self._dir(node, segment)
+        clusters = self._leaf(node, segments[-1])
+        signature = query_signature(query)
+        cluster = clusters.get(signature)
+        if cluster is None:
+            cluster = clusters[signature] = _Cluster()
+        cluster.count += 1
+        self.urls += 1
+        if len(cluster.representatives) < self.keep:
+            cluster.representatives.append(url)
+            self.kept += 1
+            return True
+        return False
+
+    def _protected(self, text: str) -> bool:
+        return self.protect is not None and bool(self.protect(text))
+
+    def _dir(self, node: _Node, segment: str) -> _Node:
+        key = segment_template(segment)
+        child = node.dirs.get(key)
+        if child is not None:
+            return child
+        counted = self._collapsible(key, True)
+        if counted and node.dirs_collapsed:
+            return node.dirs[WILDCARD]
+        child = node.dirs[key] = _Node()
+        if counted:
+            node.dir_literals += 1
+            if node.dir_literals > self.max_children:
+                return self._collapse_dirs(node)
+        return child
+
+    def _leaf(self, node: _Node, segment: str) -> Dict[str, _Cluster]:
+        key = segment_template(segment)
+        clusters = node.leaves.get(key)
+        if clusters is not None:
+            return clusters
+        counted = self._collapsible(key, False)
+        if counted and node.leaves_collapsed:
+            key = leaf_wildcard(key)
+            clusters = node.leaves.get(key)
+            if clusters is None:
+                clusters = node.leaves[key] = {}
+            return clusters
+        clusters = node.leaves[key] = {}
+        if counted:
+            node.leaf_literals += 1
+            if node.leaf_literals > self.max_children:
+                self._collapse_leaves(node)
+                return node.leaves[leaf_wildcard(key)]
+        return clusters
+
+    def _collapsible(self, key: str, directory: bool) -> bool:
+        """Literal, non-empty and not protected; an empty final segment is the directory's own index"""
+        return bool(key) and not key.startswith('{') and not self._protected(f"/{key}/" if directory else f"/{key}")
+
+    def _collapse_dirs(self, node: _Node) -> _Node:
+        """Merge every unprotected literal directory of node into its {*} directory"""
+        wildcard = node.dirs.pop(WILDCARD, None) or _Node()
+        for key in [key for key in node.dirs if self._collapsible(key, True)]:
+            self._merge(wildcard, node.dirs.pop(key))
+        node.dirs[WILDCARD] = wildcard
+        node.dirs_collapsed = True
+        node.dir_literals = 0
+        return wildcard
+
+    def _collapse_leaves(self, node: _Node):
+        """Merge every unprotected literal final segment of node into {*} with the same extension"""
+        for key in [key for key in node.leaves if self._collapsible(key, False)]:
+            clusters = node.leaves.pop(key)
+            self._merge_clusters(node.leaves.setdefault(leaf_wildcard(key), {}), clusters)
+        node.leaves_collapsed = True
+        node.leaf_literals = 0
+
+    def _merge_clusters(self, target: Dict[str, _Cluster], source: Dict[str, _Cluster]):
+        for signature, cluster in source.items():
+            existing = target.get(signature)
+            if existing is None:
+                target[signature] = cluster
+                continue
+            existing.count += cluster.count
+            room = self.keep - len(existing.representatives)
+            if room > 0:
+                existing.representatives.extend(cluster.representatives[:room])
+
+    def _merge(self, target: _Node, source: _Node):
+        for key, clusters in source.leaves.items():
+            collapsible = self._collapsible(key, False)
+            if collapsible and target.leaves_collapsed:
+                key = leaf_wildcard(key)
+            elif collapsible and key not in target.leaves:
+                target.leaf_literals += 1
+            self._merge_clusters(target.leaves.setdefault(key, {}), clusters)
+        for key, child in source.dirs.items():
+            collapsible = self._collapsible(key, True)
+            if collapsible and target.dirs_collapsed:
+                key = WILDCARD
+            if key in target.dirs:
+                self._merge(target.dirs[key], child)
+            else:
+                target.dirs[key] = child
+                if collapsible:
+                    target.dir_literals += 1
+        if target.leaf_literals > self.max_children and not target.leaves_collapsed:
+            self._collapse_leaves(target)
+        if target.dir_literals > self.max_children and not target.dirs_collapsed:
+            self._collapse_dirs(target)
+
+    def cluster_batch(self, batch: URLBatch) -> URLBatch:
+        """The representatives of a batch, column-wise like URLFilter.filter_batch"""
+        add = self.add
+        clustered = URLBatch()
+        append_row = clustered.append_row
+        for url, source, timestamp, status in zip(batch.urls, batch.sources, batch.timestamps, batch.status_codes):
+            if add(url):
+                append_row(url, source, timestamp, status)
+        return clustered
+
+    def clusters(self) -> Iterator[Tuple[str, int, List[str]]]:
+        """(template, count, representatives) for every template, largest first"""
+        found = []
+        for host, root in self.hosts.items():
+            stack = [(root, '')]
+            while stack:
+                node, path = stack.pop()
+                for key, clusters in node.leaves.items():
+                    for signature, cluster in clusters.items():
+                        found.append((f"{host}{path}/{key}{signature}", cluster.count, cluster.representatives))
+                for key, child in node.dirs.items():
+                    stack.append((child, f"{path}/{key}"))
+        found.sort(key=lambda item: (-item[1], item[0]))
+        return iter(found)
+
+    def write_report(self, path: str) -> int:
+        """Write one JSON line per template; returns the number of templates"""
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for template, urls, representatives in self.clusters():
+                f.write(json.dumps({'template': template, 'count': urls, 'urls': representatives},
+                                   ensure_ascii=False) + '\n')
+                count += 1
+        return count
@@ -0,0 +1,182 @@
+# core/dedupe.py
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import List, Optional
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Rough cost of one 64-bit key in a Python set (int object plus its share of the hash table)
+_BYTES_PER_KEY = 80
+
+# Approximate mode starts with a Bloom filter sized for this many keys at this false positive rate
+DEFAULT_EXPECTED_KEYS = 1000000
+DEFAULT_ERROR_RATE = 0.001
+
+def _signed(value: int) -> int:
+    """Fold a hash into SQLite's signed 64-bit integer range"""
+    value &= 0xFFFFFFFFFFFFFFFF
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one 64-bit hash"""
+
+    def __init__(self, size_bytes: int, hashes: int = 7):
+        self.bits = bytearray(max(size_bytes, 1))
+        self.size = len(self.bits) * 8
+        self.hashes = hashes
+
+    @classmethod
+    def for_capacity(cls, keys: int, error_rate: float) -> 'BloomFilter':
+        """A filter that holds keys at about error_rate false positives"""
+        bits = math.ceil(-max(keys, 1) * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / max(keys, 1) * math.log(2)))
+        return cls(-(-bits // 8), hashes)
+
+    @staticmethod
+    def bytes_for(keys: int, error_rate: float) -> int:
+        return -(-math.ceil(-max(keys, 1) * math.log(error_rate) / math.log(2) ** 2) // 8)
+
+    def _positions(self, key_hash: int):
+        h1 = key_hash & 0xFFFFFFFF
+        h2 = (key_hash >> 32) & 0xFFFFFFFF | 1
+        size = self.size
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % size
+
+    def add(self, key_hash: int) -> bool:
+        """Set the key's bits; returns True if at least one bit was unset (definitely new)"""
+        new = False
+        bits = self.bits
+        for position in self._positions(key_hash):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        return new
+
+    def __contains__(self, key_hash: int) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key_hash))
+
+class Deduplicator:
+    """Seen-set for URL dedupe that stays within a memory budget.
+
+    Keys are kept as 64-bit hashes in memory. Once the in-memory set would
+    exceed the budget it is spilled to an on-disk SQLite store fronted by a
+    Bloom filter, so most lookups of new keys never touch disk. In approximate
+    mode only a Bloom filter sized to the budget is kept, which may drop a
+    small fraction of unique keys and never spills.
+
+    The approximate filter starts sized for expected_keys at error_rate. Each
+    time it fills up, a filter twice as large with half the error rate is added,
+    so the overall rate stays near error_rate. Once the next filter would not
+    fit the budget, the last one keeps taking keys and the rate climbs.
+
+    Exact mode compares 64-bit hashes of the keys, so two URLs whose hashes
+    collide (about one chance in 10^19 per pair) count as one.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, approximate: bool = False,
+                 spill_dir: Optional[str] = None, expected_keys: int = DEFAULT_EXPECTED_KEYS,
+                 error_rate: float = DEFAULT_ERROR_RATE):
+        self.memory_budget = memory_budget
+        self.approximate = approximate
+        self.spill_dir = spill_dir
+        self.count = 0
+        self.spilled = 0
+        self._keys = set()
+        # Keep a quarter of the budget for the Bloom filter in front of the spill store
+        self._max_keys = max(1, (memory_budget * 3 // 4) // _BYTES_PER_KEY)
+        self._bloom: Optional[BloomFilter] = None
+        self._filters: List[BloomFilter] = []
+        if approximate:
+            # Start no bigger than the budget, however many keys are expected
+            capacity = max(1, expected_keys)
+            while capacity > 1 and BloomFilter.bytes_for(capacity, error_rate) > memory_budget:
+                capacity //= 2
+            self._filters.append(BloomFilter.for_capacity(capacity, error_rate))
+            self._capacity = capacity
+            self._error_rate = error_rate
+            self._filled = 0
+            self._can_grow = True
+        self._db: Optional[sqlite3.Connection] = None
+        self._tmpdir: Optional[str] = None
+
+    def _grow(self):
+        """Add a filter twice as large with half the error rate, if it fits the budget"""
+        capacity, error_rate = self._capacity * 2, self._error_rate / 2
+        used = sum(len(bloom.bits) for bloom in self._filters)
+        if used + BloomFilter.bytes_for(capacity, error_rate) > self.memory_budget:
+            self._can_grow = False
+            return
+        self._filters.append(BloomFilter.for_capacity(capacity, error_rate))
+        self._capacity, self._error_rate, self._filled = capacity, error_rate, 0
+
+    def add(self, key: str) -> bool:
+        """Record key; returns True if it had not been seen before"""
+        key_hash = hash(key)
+        if self.approximate:
+            filters = self._filters
+            if len(filters) > 1 and any(key_hash in bloom for bloom in filters[:-1]):
+                return False
+            if not filters[-1].add(key_hash):
+                return False
+            self.count += 1
+            self._filled += 1
+            if self._can_grow and self._filled >= self._capacity:
+                self._grow()
+            return True
+        if key_hash in self._keys:
+            return False
+        if self._db is not None and key_hash in self._bloom and self._on_disk(key_hash):
+            return False
+        self._keys.add(key_hash)
+        self.count += 1
+        if len(self._keys) >= self._max_keys:
+            self._spill()
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        key_hash = hash(key)
+        if self.approximate:
+            return any(key_hash in bloom for bloom in self._filters)
+        if key_hash in self._keys:
+            return True
+        return self._db is not None and key_hash in self._bloom and self._on_disk(key_hash)
+
+    def _on_disk(self, key_hash: int) -> bool:
+        return self._db.execute("SELECT 1 FROM seen WHERE key = ?", (_signed(key_hash),)).fetchone() is not None
+
+    def _spill(self):
+        """Move the in-memory keys to the on-disk store"""
+        if self._db is None:
+            self._tmpdir = tempfile.mkdtemp(prefix='pybackurls-dedupe-', dir=self.spill_dir)
+            self._db = sqlite3.connect(os.path.join(self._tmpdir, 'seen.db'))
+            self._db.execute("PRAGMA journal_mode = OFF")
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("CREATE TABLE seen (key INTEGER PRIMARY KEY) WITHOUT ROWID")
+            self._bloom = BloomFilter(self.memory_budget // 4)
+        for key_hash in self._keys:
+            self._bloom.add(key_hash)
+        self._db.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)",
+                             ((_signed(key_hash),) for key_hash in sorted(self._keys)))
+        self._db.commit()
+        self.spilled += len(self._keys)
+        self._keys = set()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
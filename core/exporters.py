@@ -1,75 +1,282 @@
 # core/exporters.py
 import json
 import csv
+import gzip
+import io
+import os
 from datetime import datetime
-from typing import List, Dict
-import xml.etree.ElementTree as ET
+from typing import List, Dict, Optional
+
+from .records import iter_rows
+from .store import StoreStreamWriter, write_store
+
+COMPRESSIONS = ('gzip', 'zstd')
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Large write buffer so rows reach the (possibly compressed) file in big chunks
+WRITE_BUFFER = 1024 * 1024
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _open_output(path: str, compress: Optional[str]):
+    """Text stream for path, compressing on the fly when requested"""
+    if compress == 'gzip':
+        raw = gzip.open(path, 'wb', compresslevel=6)
+    elif compress == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    elif compress is None:
+        raw = open(path, 'wb')
+    else:
+        raise ValueError(f"Unknown compression: {compress}")
+    buffered = io.BufferedWriter(raw, buffer_size=WRITE_BUFFER) if compress else raw
+    return io.TextIOWrapper(buffered, encoding='utf-8', newline='', write_through=False)
+
+class StreamWriter:
+    """Writes results one at a time as they arrive, with optional compression and size-based sharding.
+
+    With shard_size set, output rotates to a new file once the current one has
+    received that many bytes (before compression). Every shard is a complete
+    file of its format.
+    """
+
+    def __init__(self, filename: str, compress: Optional[str] = None, shard_size: Optional[int] = None):
+        self.filename = filename
+        self.compress = compress
+        self.shard_size = shard_size
+        self.count = 0
+        self.statistics = None
+        self.paths: List[str] = []
+        self.file = None
+        self._shard_count = 0
+        self._shard_bytes = 0
+        self._open_shard()
+
+    def _shard_path(self, index: int) -> str:
+        path = self.filename
+        if self.shard_size:
+            base, ext = os.path.splitext(path)
+            path = f"{base}-{index:05d}{ext}"
+        if self.compress and not path.endswith(COMPRESSION_SUFFIXES[self.compress]):
+            path += COMPRESSION_SUFFIXES[self.compress]
+        return path
+
+    def _open_shard(self):
+        path = self._shard_path(len(self.paths))
+        self.paths.append(path)
+        self.file = _open_output(path, self.compress)
+        self._shard_count = 0
+        self._shard_bytes = 0
+        self._start()
+
+    def _emit(self, text: str):
+        self.file.write(text)
+        # Count encoded bytes; only ASCII text has one byte per character
+        self._shard_bytes += len(text) if text.isascii() else len(text.encode('utf-8'))
+
+    def write(self, result):
+        self.write_row(result.url, result.source, result.timestamp, result.status_code)
+
+    def write_row(self, url: str, source: str, timestamp: str, status_code: Optional[int]):
+        if self.shard_size and self._shard_bytes >= self.shard_size and self._shard_count:
+            self._finish(last=False)
+            self.file.close()
+            self._open_shard()
+        self._write(url, source, timestamp, status_code)
+        self.count += 1
+        self._shard_count += 1
+
+    def set_statistics(self, stats: Dict):
+        """Statistics to include when the format supports them; written on close"""
+        self.statistics = stats
+
+    def close(self):
+        if self.file is not None:
+            self._finish(last=True)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _start(self):
+        pass
+
+    def _write(self, url, source, timestamp, status_code):
+        raise NotImplementedError
+
+    def _finish(self, last: bool):
+        pass
+
+class TxtStreamWriter(StreamWriter):
+    def __init__(self, *args, include_metadata: bool = False, header: str = '', **kwargs):
+        self.include_metadata = include_metadata
+        self.header = header
+        super().__init__(*args, **kwargs)
+
+    def _start(self):
+        if self.header:
+            self._emit(self.header)
+
+    def _write(self, url, source, timestamp, status_code):
+        if self.include_metadata:
+            self._emit(f"{url} # {source} {timestamp}\n")
+        else:
+            self._emit(f"{url}\n")
+
+class CsvStreamWriter(StreamWriter):
+    class _Target:
+        """csv.writer target routing through _emit so rows count towards the shard size"""
+
+        def __init__(self, emit):
+            self.write = emit
+
+    def _start(self):
+        self.writer = csv.writer(self._Target(self._emit))
+        self.writer.writerow(['URL', 'Source', 'Timestamp', 'Status Code'])
+
+    def _write(self, url, source, timestamp, status_code):
+        self.writer.writerow([url, source, timestamp, status_code])
+
+class JsonlStreamWriter(StreamWriter):
+    """One JSON object per line"""
+
+    def _write(self, url, source, timestamp, status_code):
+        record = {'url': url, 'source': source, 'timestamp': timestamp, 'status_code': status_code}
+        self._emit(json.dumps(record, ensure_ascii=False) + '\n')
+
+class JsonStreamWriter(StreamWriter):
+    """Streams the urls array first and writes metadata once the total is known"""
+
+    def _start(self):
+        self._emit('{\n  "urls": [')
+
+    def _write(self, url, source, timestamp, status_code):
+        record = {
+            'url': url,
+            'source': source,
+            'timestamp': timestamp,
+            'status_code': status_code
+        }
+        separator = ',\n    ' if self._shard_count else '\n    '
+        self._emit(separator + json.dumps(record, ensure_ascii=False))
+
+    def _finish(self, last: bool):
+        metadata = {
+            'exported_at': datetime.now().isoformat(),
+            'total_urls': self._shard_count,
+            'tool': 'PyWayback v2.0'
+        }
+        self._emit('\n  ],\n  "metadata": ' + json.dumps(metadata))
+        if last and self.statistics:
+            self._emit(',\n  "statistics": ' + json.dumps(self.statistics, ensure_ascii=False))
+        self._emit('\n}\n')
+
+class HtmlStreamWriter(StreamWriter):
+    """Statistics known up front go above the URL list; ones set later are appended below it"""
+
+    def __init__(self, *args, leading_stats: Optional[Dict] = None, **kwargs):
+        self.leading_stats = leading_stats
+        super().__init__(*args, **kwargs)
+
+    def _start(self):
+        self._emit(URLExporter._html_header())
+        if self.leading_stats and len(self.paths) == 1:
+            self._emit(URLExporter._html_stats(self.leading_stats))
+        self._emit("<div class='url-list'><h2>🔗 Discovered URLs</h2>")
+
+    def _write(self, url, source, timestamp, status_code):
+        self._emit(URLExporter._html_item(url, source, timestamp))
+
+    def _finish(self, last: bool):
+        self._emit("</div>")
+        if last and self.statistics and not self.leading_stats:
+            self._emit(URLExporter._html_stats(self.statistics))
+        self._emit("</body></html>")
+
+STREAM_WRITERS = {
+    'txt': TxtStreamWriter,
+    'csv': CsvStreamWriter,
+    'json': JsonStreamWriter,
+    'jsonl': JsonlStreamWriter,
+    'html': HtmlStreamWriter,
+    'store': StoreStreamWriter,
+}
 
 class URLExporter:
-    def __init__(self, display_manager=None):
+    def __init__(self, display_manager=None, compress: Optional[str] = None, shard_size: Optional[int] = None):
         self.display = display_manager
-    
-    def export_json(self, url_results: List, filename: str, include_stats: bool = True):
-        """Export results as JSON with optional statistics"""
-        data = {
-            'metadata': {
-                'exported_at': datetime.now().isoformat(),
-                'total_urls': len(url_results),
-                'tool': 'PyWayback v2.0'
-            },
-            'urls': [
-                {
-                    'url': result.url,
-                    'source': result.source,
-                    'timestamp': result.timestamp,
-                    'status_code': result.status_code
-                }
-                for result in url_results
-            ]
-        }
-        
-        if include_stats:
+        self.compress = compress
+        self.shard_size = shard_size
+
+    def open_stream(self, fmt: str, filename: str, **options) -> StreamWriter:
+        """Open a writer that exports results as they arrive"""
+        return STREAM_WRITERS[fmt](filename, compress=self.compress, shard_size=self.shard_size, **options)
+
+    def _export(self, fmt: str, url_results, filename: str, stats: Dict = None, **options) -> StreamWriter:
+        with self.open_stream(fmt, filename, **options) as writer:
+            write_row = writer.write_row
+            for row in iter_rows(url_results):
+                write_row(*row)
+            if stats:
+                writer.set_statistics(stats)
+        return writer
+
+    def _report(self, writer: StreamWriter, label: str = None):
+        if self.display:
+            target = writer.paths[0] if len(writer.paths) == 1 else f"{len(writer.paths)} files ({writer.paths[0]} ...)"
+            message = label or f"Exported {writer.count} URLs"
+            self.display.console.print(f"[*] {message} to {target}", style="green")
+
+    def export_json(self, url_results: List, filename: str, include_stats: bool = True, stats: Dict = None):
+        """Export results as JSON with optional statistics, reusing stats when already computed"""
+        if include_stats and stats is None:
             from .analyzer import URLAnalyzer
-            analyzer = URLAnalyzer()
-            data['statistics'] = analyzer.analyze_urls(url_results)
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
+            stats = URLAnalyzer().analyze_urls(url_results)
+        self._report(self._export('json', url_results, filename, stats if include_stats else None))
+
+    def export_jsonl(self, url_results: List, filename: str):
+        """Export results as JSON Lines, one object per URL"""
+        self._report(self._export('jsonl', url_results, filename))
+
+    def export_store(self, url_results, filename: str):
+        """Export results as an indexed store for the query command"""
+        # Written straight from the columns; the store is never compressed or sharded
+        count = write_store(url_results, filename)
         if self.display:
-            self.display.console.print(f"[*] Exported {len(url_results)} URLs to {filename}", style="green")
-    
+            self.display.console.print(f"[*] Exported {count} URLs to {filename}", style="green")
+
     def export_csv(self, url_results: List, filename: str):
         """Export results as CSV"""
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['URL', 'Source', 'Timestamp', 'Status Code'])
-            
-            for result in url_results:
-                writer.writerow([result.url, result.source, result.timestamp, result.status_code])
-        
-        if self.display:
-            self.display.console.print(f"[*] Exported {len(url_results)} URLs to {filename}", style="green")
-    
+        self._report(self._export('csv', url_results, filename))
+
     def export_txt(self, url_results: List, filename: str, include_metadata: bool = False):
         """Export results as plain text"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            if include_metadata:
-                f.write(f"# PyWayback Export - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# Total URLs: {len(url_results)}\n\n")
-            
-            for result in url_results:
-                if include_metadata:
-                    f.write(f"{result.url} # {result.source} {result.timestamp}\n")
-                else:
-                    f.write(f"{result.url}\n")
-        
-        if self.display:
-            self.display.console.print(f"[*] Exported {len(url_results)} URLs to {filename}", style="green")
-    
+        header = ''
+        if include_metadata:
+            header = (f"# PyWayback Export - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                      f"# Total URLs: {len(url_results)}\n\n")
+        self._report(self._export('txt', url_results, filename, include_metadata=include_metadata, header=header))
+
     def export_html(self, url_results: List, filename: str, stats: Dict = None):
         """Export results as HTML report"""
-        html_content = f"""
+        writer = self._export('html', url_results, filename, leading_stats=stats)
+        self._report(writer, "Exported HTML report")
+
+    @staticmethod
+    def _html_header() -> str:
+        return f"""
         <!DOCTYPE html>
         <html>
         <head>
@@ -89,33 +296,27 @@ class URLExporter:
                 <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
             </div>
         """
-        
-        if stats:
-            html_content += "<div class='stats'><h2>📊 Statistics</h2>"
-            for key, value in stats.items():
-                html_content += f"<p><strong>{key.replace('_', ' ').title()}:</strong> {value}</p>"
-            html_content += "</div>"
-        
-        html_content += "<div class='url-list'><h2>🔗 Discovered URLs</h2>"
-        for result in url_results:
-            css_class = "url-item suspicious" if self._is_suspicious_url(result.url) else "url-item"
-            html_content += f"""
+
+    @staticmethod
+    def _html_stats(stats: Dict) -> str:
+        parts = ["<div class='stats'><h2>📊 Statistics</h2>"]
+        for key, value in stats.items():
+            parts.append(f"<p><strong>{key.replace('_', ' ').title()}:</strong> {value}</p>")
+        parts.append("</div>")
+        return ''.join(parts)
+
+    @staticmethod
+    def _html_item(url: str, source: str, timestamp: str) -> str:
+        css_class = "url-item suspicious" if URLExporter._is_suspicious_url(url) else "url-item"
+        return f"""
             <div class="{css_class}">
-                <a href="{result.url}" target="_blank">{result.url}</a>
-                <small> - Source: {result.source} | Time: {result.timestamp}</small>
+                <a href="{url}" target="_blank">{url}</a>
+                <small> - Source: {source} | Time: {timestamp}</small>
             </div>
             """
-        
-        html_content += "</div></body></html>"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        if self.display:
-            self.display.console.print(f"[*] Exported HTML report to {filename}", style="green")
-    
-    def _is_suspicious_url(self, url: str) -> bool:
+
+    @staticmethod
+    def _is_suspicious_url(url: str) -> bool:
         """Quick check if URL looks suspicious"""
         suspicious_indicators = ['/admin', '/config', '.env', '.bak', '/private']
         return any(indicator in url.lower() for indicator in suspicious_indicators)
-
@@ -1,126 +1,276 @@
 # core/filters.py
 from datetime import datetime
-from urllib.parse import urlparse
-from typing import List
+from urllib.parse import unquote, urlparse
+from typing import Iterable, Iterator, List, Optional
 import re
 
+from .dedupe import DEFAULT_MEMORY_BUDGET, Deduplicator
+from .records import URLBatch
+from .urls import split_url, strip_params
+
+def _compile_substrings(patterns: Optional[Iterable[str]], flags: int = 0):
+    """One alternation regex matching any of the literal substrings, or None"""
+    patterns = [pattern for pattern in (patterns or []) if pattern]
+    if not patterns:
+        return None
+    # Longest first so the alternation never stops at a shorter prefix
+    patterns.sort(key=len, reverse=True)
+    return re.compile('|'.join(re.escape(pattern) for pattern in patterns), flags)
+
+def _compile_regexes(patterns: Optional[Iterable[str]], flags: int = re.IGNORECASE):
+    patterns = [pattern for pattern in (patterns or []) if pattern]
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), flags)
+
+def date_to_int(date: Optional[str], end_of_day: bool = False) -> Optional[int]:
+    """YYYY-MM-DD to a 14-digit archive timestamp integer, parsed once"""
+    if not date:
+        return None
+    day = int(datetime.strptime(date, '%Y-%m-%d').strftime('%Y%m%d'))
+    return day * 1000000 + (235959 if end_of_day else 0)
+
+# A literal dot in a CDX filter regex, or its percent-encoding
+_CDX_DOT = r'(?:\.|%2[eE])'
+
+# Raw host and path characters that cannot decode to a query, fragment or params separator
+_CDX_HOST_CHAR = r'(?:[^/?#%]|%(?!3[fF]|23))'
+_CDX_PATH_CHAR = r'(?:[^?#;%]|%(?!3[fFbB]|23))'
+
+# Unreserved characters that archived URLs carry as is; even '.' and '/' turn up as %2E and %2F
+_CDX_PLAIN = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_~-')
+
+def _cdx_char(char: str) -> str:
+    """Regex for one character of a literal as it may appear in the raw 'original': plain or percent-encoded"""
+    if char in _CDX_PLAIN:
+        return re.escape(char)
+    encoded = ''.join('%' + ''.join(f'[{digit}{digit.lower()}]' if digit.isalpha() else digit for digit in f'{byte:02X}')
+                      for byte in char.encode('utf-8'))
+    return f'(?:{re.escape(char)}|{encoded})'
+
+def _cdx_substrings(patterns: Iterable[str], exclude: bool = False) -> Optional[str]:
+    """Regex for a CDX filter on 'original' containing any of the literals; None if one cannot be pushed down.
+
+    CDX sees the raw, percent-encoded URL while the local check sees the decoded
+    one, so every character that may be escaped also matches its %XX form.
+    Literals with a percent sign cannot be matched reliably and are not pushed
+    down. For excludes a match may not start inside an escape, where the decoded
+    URL no longer has those characters.
+    """
+    patterns = [pattern for pattern in patterns if pattern]
+    if not patterns or any('%' in pattern for pattern in patterns):
+        return None
+    alternatives = '|'.join(''.join(_cdx_char(char) for char in pattern) for pattern in patterns)
+    guard = r'(?<!%)(?<!%[0-9A-Fa-f])' if exclude else ''
+    return f'.*{guard}(?:{alternatives}).*'
+
+class _ExtensionSet:
+    """Extension matcher: set lookup on the path suffix, endswith for multi-dot extensions like tar.gz"""
+
+    def __init__(self, extensions: Iterable[str]):
+        extensions = {ext.lower().strip().strip('.') for ext in extensions if ext.strip().strip('.')}
+        self.simple = {ext for ext in extensions if '.' not in ext}
+        self.dotted = tuple(f'.{ext}' for ext in extensions if '.' in ext)
+
+    def __bool__(self):
+        return bool(self.simple or self.dotted)
+
+    def matches(self, path: str) -> bool:
+        """path must already be lowercased"""
+        if self.simple:
+            head, dot, suffix = path.rpartition('.')
+            if dot and suffix in self.simple:
+                return True
+        return bool(self.dotted) and path.endswith(self.dotted)
+
+    def cdx_pattern(self, exclude: bool = False) -> str:
+        """Regex for a CDX filter on 'original': the path (not the host) ends in one of the extensions.
+
+        Dots, slashes and separators may be percent-encoded in the archived URL,
+        since the local check runs on the decoded one, and ;params may follow the
+        extension. For excludes the host and path may hold no escaped separator
+        and the path no params, so only URLs whose decoded path surely ends in
+        the extension are dropped.
+        """
+        names = sorted(self.simple) + sorted(ext[1:] for ext in self.dotted)
+        alternatives = '|'.join(re.escape(name).replace(r'\.', _CDX_DOT) for name in names)
+        if exclude:
+            return (rf"(?i)[^:/?#]+://{_CDX_HOST_CHAR}*/{_CDX_PATH_CHAR}*{_CDX_DOT}(?:{alternatives})"
+                    r"(?:(?:[?#]|%3f|%23).*)?")
+        return rf"(?i)[^:/?#]+://[^/?#]*(?:/|%2f)[^?#]*{_CDX_DOT}(?:{alternatives})(?:(?:[?#;]|%3[fb]|%23).*)?"
+
 class URLFilter:
-    def __init__(self):
-        pass
-    
+    def __init__(self, allowed_schemes: Optional[Iterable[str]] = None, min_length: int = 0,
+                 extensions: Optional[Iterable[str]] = None, exclude_extensions: Optional[Iterable[str]] = None,
+                 include: Optional[Iterable[str]] = None, exclude: Optional[Iterable[str]] = None,
+                 start_date: Optional[str] = None, end_date: Optional[str] = None, decode: bool = True,
+                 dedupe_memory: int = DEFAULT_MEMORY_BUDGET, dedupe_approximate: bool = False):
+        """Compile every filtering option into a single predicate applied in one pass"""
+        self.allowed_schemes = frozenset(scheme.lower() for scheme in allowed_schemes) if allowed_schemes else None
+        self.min_length = min_length
+        self.extensions = _ExtensionSet(extensions or [])
+        self.exclude_extensions = _ExtensionSet(exclude_extensions or [])
+        self.include = _compile_substrings(include)
+        self.exclude = _compile_substrings(exclude)
+        self.include_patterns = list(include or [])
+        self.exclude_patterns = list(exclude or [])
+        self.start_date = date_to_int(start_date)
+        self.end_date = date_to_int(end_date, end_of_day=True)
+        self.decode = decode
+        self.dedupe_memory = dedupe_memory
+        self.dedupe_approximate = dedupe_approximate
+        self._needs_path = bool(self.extensions or self.exclude_extensions)
+
+    def cdx_filters(self) -> List[str]:
+        """The extension and pattern options as Wayback CDX filter= values.
+
+        Each keeps at least every row the local check would, so the archive can
+        drop the rest before they are sent; the local check still runs on what
+        comes back.
+        """
+        filters = []
+        if self.extensions:
+            filters.append('original:' + self.extensions.cdx_pattern())
+        if self.exclude_extensions:
+            filters.append('!original:' + self.exclude_extensions.cdx_pattern(exclude=True))
+        include = _cdx_substrings(self.include_patterns)
+        if include:
+            filters.append('original:' + include)
+        exclude = _cdx_substrings(self.exclude_patterns, exclude=True)
+        if exclude:
+            filters.append('!original:' + exclude)
+        return filters
+
+    def new_deduplicator(self) -> Deduplicator:
+        """Seen-set honouring the configured memory budget"""
+        return Deduplicator(memory_budget=self.dedupe_memory, approximate=self.dedupe_approximate)
+
+    def clean(self, result):
+        """Decode and check one result; returns it with its cleaned URL, or None if it is rejected"""
+        url = self._check(result.url, result.timestamp_value)
+        if url is None:
+            return None
+        # Update the result's URL field to make sure it's decoded/cleaned everywhere else
+        result.url = url
+        return result
+
+    def _check(self, url: str, timestamp: int) -> Optional[str]:
+        """The compiled predicate: the cleaned URL if it passes every option, else None"""
+        url = unquote(url).strip() if self.decode else url
+        if not url or len(url) < self.min_length:
+            return None
+        if self.allowed_schemes is not None or self._needs_path:
+            scheme, netloc, path, query = split_url(url)
+            if self.allowed_schemes is not None and (scheme or '').lower() not in self.allowed_schemes:
+                return None
+            if self._needs_path:
+                path = strip_params(path).lower()
+                if self.extensions and not self.extensions.matches(path):
+                    return None
+                if self.exclude_extensions and self.exclude_extensions.matches(path):
+                    return None
+        if self.include is not None and self.include.search(url) is None:
+            return None
+        if self.exclude is not None and self.exclude.search(url) is not None:
+            return None
+        if self.start_date is not None or self.end_date is not None:
+            if not timestamp:
+                return None
+            if self.start_date is not None and timestamp < self.start_date:
+                return None
+            if self.end_date is not None and timestamp > self.end_date:
+                return None
+        return url
+
+    def apply(self, url_results: Iterable, deduplicate: bool = True) -> Iterator:
+        """Single pass over url_results yielding cleaned, optionally deduplicated results"""
+        clean = self.clean
+        if not deduplicate:
+            for result in url_results:
+                if clean(result) is not None:
+                    yield result
+            return
+        with self.new_deduplicator() as seen:
+            for result in url_results:
+                if clean(result) is not None and seen.add(result.url):
+                    yield result
+
+    def filter_urls(self, url_results: Iterable, deduplicate: bool = True) -> List:
+        return list(self.apply(url_results, deduplicate))
+
+    def filter_batch(self, batch: URLBatch, deduplicate: bool = True) -> URLBatch:
+        """Apply the predicate column-wise to a URLBatch without materialising per-row objects"""
+        check = self._check
+        filtered = URLBatch()
+        append_row = filtered.append_row
+        with self.new_deduplicator() as seen:
+            for url, source, timestamp, status in zip(batch.urls, batch.sources, batch.timestamps, batch.status_codes):
+                url = check(url, timestamp)
+                if url is None:
+                    continue
+                if deduplicate and not seen.add(url):
+                    continue
+                append_row(url, source, timestamp, status)
+        return filtered
+
     def filter_by_extensions(self, url_results: List, extensions: List[str], exclude: bool = False) -> List:
         """Filter URLs by file extensions"""
+        matcher = _ExtensionSet(extensions)
+        if not matcher:  # No filter specified
+            return list(url_results)
+
         filtered = []
-        extensions = [ext.lower().strip('.') for ext in extensions]
-        
         for result in url_results:
-            url_path = urlparse(result.url).path.lower()
-            has_extension = any(url_path.endswith(f'.{ext}') for ext in extensions)
-            
-            if exclude and not has_extension:
+            url_path = split_url(result.url)[2].lower()
+            if matcher.matches(url_path) != exclude:
                 filtered.append(result)
-            elif not exclude and has_extension:
-                filtered.append(result)
-            elif not extensions:  # No filter specified
-                filtered.append(result)
-        
+
         return filtered
-    
+
     def filter_by_date_range(self, url_results: List, start_date: str = None, end_date: str = None) -> List:
         """Filter URLs by date range (YYYY-MM-DD format)"""
         if not start_date and not end_date:
             return url_results
-        
-        filtered = []
-        for result in url_results:
-            if not result.timestamp or len(result.timestamp) < 8:
-                continue
-            
-            try:
-                url_date = datetime.strptime(result.timestamp[:8], '%Y%m%d')
-                
-                if start_date:
-                    start = datetime.strptime(start_date, '%Y-%m-%d')
-                    if url_date < start:
-                        continue
-                
-                if end_date:
-                    end = datetime.strptime(end_date, '%Y-%m-%d')
-                    if url_date > end:
-                        continue
-                
-                filtered.append(result)
-            except ValueError:
-                continue
-        
-        return filtered
-    
-    def filter_by_patterns(self, url_results: List, include_patterns: List[str] = None, 
+
+        date_filter = URLFilter(start_date=start_date, end_date=end_date, decode=False)
+        return date_filter.filter_urls(url_results, deduplicate=False)
+
+    def filter_by_patterns(self, url_results: List, include_patterns: List[str] = None,
                           exclude_patterns: List[str] = None) -> List:
         """Filter URLs by regex patterns"""
+        include = _compile_regexes(include_patterns)
+        exclude = _compile_regexes(exclude_patterns)
         filtered = []
-        
+
         for result in url_results:
             url = result.url
-            
+
             # Check include patterns
-            if include_patterns:
-                if not any(re.search(pattern, url, re.IGNORECASE) for pattern in include_patterns):
-                    continue
-            
+            if include is not None and include.search(url) is None:
+                continue
+
             # Check exclude patterns
-            if exclude_patterns:
-                if any(re.search(pattern, url, re.IGNORECASE) for pattern in exclude_patterns):
-                    continue
-            
+            if exclude is not None and exclude.search(url) is not None:
+                continue
+
             filtered.append(result)
-        
+
         return filtered
-    
+
     def deduplicate_urls(self, url_results: List, by_url: bool = True, by_path: bool = False) -> List:
         """Remove duplicate URLs"""
-        seen = set()
         filtered = []
-        
-        for result in url_results:
-            if by_url:
-                key = result.url
-            elif by_path:
-                key = urlparse(result.url).path
-            else:
-                key = result.url
-            
-            if key not in seen:
-                seen.add(key)
-                filtered.append(result)
-        
-        return filtered
-    from urllib.parse import unquote, urlparse
 
-    def clean_and_filter_urls(url_results, allowed_schemes=('http', 'https'),
-                         min_length=10, filter_ext=None, filter_patterns=None, exclude_patterns=None):
-        unique = set()
-        filtered = []
-        for result in url_results:
-            url = unquote(result.url).strip()
-            parsed = urlparse(url)
-            if not url:
-                continue
-            if parsed.scheme not in allowed_schemes:
-                continue
-            if len(url) < min_length:
-                continue
-            if filter_ext:
-                if not any(parsed.path.lower().endswith(f".{ext}") for ext in filter_ext):
-                    continue
-            if filter_patterns:
-                if not any(pat in url for pat in filter_patterns):
-                    continue
-            if exclude_patterns:
-                if any(pat in url for pat in exclude_patterns):
-                    continue
-            if url not in unique:
-                unique.add(url)
-                filtered.append(result)
-        return filtered
+        with self.new_deduplicator() as seen:
+            for result in url_results:
+                if by_url:
+                    key = result.url
+                elif by_path:
+                    key = urlparse(result.url).path
+                else:
+                    key = result.url
 
+                if seen.add(key):
+                    filtered.append(result)
+
+        return filtered
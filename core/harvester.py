@@ -2,46 +2,276 @@
 # core/harvester.py
 import os
 import asyncio
+import contextlib
+import functools
 import aiohttp
-import json
+import re
 import time
-from datetime import datetime
-from urllib.parse import urlparse
-from typing import List, Dict, Optional
-from dataclasses import dataclass
-
-@dataclass
-class URLResult:
-    url: str
-    source: str
-    timestamp: str = ""
-    status_code: Optional[int] = None
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlparse
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Dict, Optional
+
+from .cache import NullRecorder, ResponseCache
+from .journal import HarvestJournal
+from .metrics import MetricsRegistry
+from .ratelimit import RETRYABLE_STATUSES, RateLimiter, RetryableError, backoff_delay, parse_retry_after
+from .records import URLResult, timestamp_to_int
+from .transport import TransportProfile, load_json_decoder
+
+# Default number of in-flight requests per source, so one busy archive
+# cannot take every connection in the pool
+DEFAULT_SOURCE_LIMITS = {
+    'wayback': 10,
+    'commoncrawl': 10,
+    'virustotal': 4,
+}
+
+WAYBACK_CDX_URL = "http://web.archive.org/cdx/search/cdx"
+COMMONCRAWL_INDEX_URL = "https://index.commoncrawl.org"
+VIRUSTOTAL_REPORT_URL = "https://www.virustotal.com/vtapi/v2/domain/report"
+
+# Only the columns rows are built from, instead of all seven CDX columns or every index field
+WAYBACK_FIELDS = "timestamp,original"
+COMMONCRAWL_FIELDS = "url,timestamp"
+
+# Lines parsed per timed batch; timing every line would cost more than the parsing
+DECODE_BATCH = 1000
+
+def _date_bounds(since: Optional[str], start: Optional[int], end: Optional[int]) -> str:
+    """CDX from/to parameters (inclusive, 14-digit timestamps) for an incremental run and a date window"""
+    lower = max(timestamp_to_int(since), start or 0)
+    bounds = f"&from={lower}" if lower else ""
+    if end:
+        bounds += f"&to={end}"
+    return bounds
+
+def check_cc_indexes(spec: str) -> str:
+    """Validate a Common Crawl index spec (all, latest, latest:N, YYYY-YYYY or comma-separated ids); returns it stripped"""
+    spec = (spec or 'all').strip()
+    if spec in ('all', 'latest'):
+        return spec
+    if spec.startswith('latest:'):
+        count = spec[len('latest:'):]
+        if not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Invalid Common Crawl index spec {spec!r}: latest:N needs a positive N")
+        return spec
+    window = re.match(r'^(\d{4})-(\d{4})$', spec)
+    if window:
+        if int(window.group(1)) > int(window.group(2)):
+            raise ValueError(f"Invalid Common Crawl index spec {spec!r}: the first year is after the last")
+        return spec
+    ids = [index.strip() for index in spec.split(',') if index.strip()]
+    if not ids or not all(re.match(r'^CC-MAIN-\S+$', index) for index in ids):
+        raise ValueError(f"Invalid Common Crawl index spec {spec!r}: "
+                         f"expected all, latest:N, YYYY-YYYY or ids such as CC-MAIN-2024-10")
+    return spec
 
 class URLHarvester:
-    def __init__(self, max_concurrent=50, timeout=30):
+    def __init__(self, max_concurrent=50, timeout=60, source_limits: Optional[Dict[str, int]] = None,
+                 page_concurrency=4, page_retries=3, cc_indexes='latest:4', cc_max_pages=None,
+                 cache: Optional[ResponseCache] = None, rate_limiter: Optional[RateLimiter] = None,
+                 journal: Optional[HarvestJournal] = None, metrics: Optional[MetricsRegistry] = None,
+                 pushdown: bool = True, transport: Optional[TransportProfile] = None):
+        """timeout is the seconds a response may stall before it is abandoned, unless transport sets its own"""
         self.max_concurrent = max_concurrent
-        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # Trim CDX fields and send filters to the archives; off means fetch everything and filter locally
+        self.pushdown = pushdown
+        self.cc_indexes = check_cc_indexes(cc_indexes)
+        self.cc_max_pages = cc_max_pages
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.journal = journal
+        self.metrics = metrics or MetricsRegistry()
+        self.failed_pages = 0
+        self.page_concurrency = max(1, page_concurrency)
+        self.page_retries = page_retries
+        self.transport = transport or TransportProfile(limit=max_concurrent, read_timeout=timeout)
+        self._loads = load_json_decoder(self.transport.json_decoder)
+        self.source_limits = dict(DEFAULT_SOURCE_LIMITS)
+        if source_limits:
+            self.source_limits.update(source_limits)
+        if any(limit < 1 for limit in self.source_limits.values()):
+            raise ValueError("Source limits must be at least 1")
         self.session = None
         self.results = []
+        self._source_slots: Dict[str, asyncio.Semaphore] = {}
+        self._cc_collections: Optional[List[Dict]] = None
+        self._cc_collections_lock: Optional[asyncio.Lock] = None
         
     async def __aenter__(self):
-        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
-        self.session = aiohttp.ClientSession(
-            connector=connector, 
-            timeout=self.timeout
-        )
+        self.session = self.transport.session()
+        self._source_slots = {
+            source: asyncio.Semaphore(limit)
+            for source, limit in self._fair_source_limits().items()
+        }
+        self._cc_collections_lock = asyncio.Lock()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
+
+    def _fair_source_limits(self) -> Dict[str, int]:
+        """Scale per-source limits down so together they fit the shared connection pool"""
+        total = sum(self.source_limits.values())
+        if total <= self.max_concurrent:
+            return dict(self.source_limits)
+        scale = self.max_concurrent / total
+        return {source: max(1, int(limit * scale)) for source, limit in self.source_limits.items()}
+
+    def _cache_get(self, source: str, url: str) -> Optional[bytes]:
+        return self.cache.get(source, url) if self.cache else None
+
+    def _cache_put(self, source: str, url: str, body: bytes):
+        if self.cache:
+            self.cache.put(source, url, body)
+
+    def _cached_lines(self, source: str, url: str, page: Optional[int]):
+        return self.cache.iter_lines(source, url, page) if self.cache else None
+
+    def _recorder(self, source: str, url: str, page: Optional[int]):
+        return self.cache.recorder(source, url, page) if self.cache else NullRecorder()
+
+    def _slot(self, source: str) -> asyncio.Semaphore:
+        """Per-source request limiter shared by every domain in flight"""
+        if source not in self._source_slots:
+            self._source_slots[source] = asyncio.Semaphore(self.max_concurrent)
+        return self._source_slots[source]
+
+    @contextlib.asynccontextmanager
+    async def _request(self, source: str, url: str):
+        """GET url under the source's slot and the host's rate limiter.
+
+        429/5xx overload answers and timeouts shrink the host's window, honour
+        Retry-After and raise RetryableError; anything else counts as a success.
+        """
+        host = self.rate_limiter.for_url(url)
+        metrics = self.metrics
+        async with self._slot(source):
+            epoch = await host.acquire()
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                async with self.session.get(url) as response:
+                    status = response.status
+                    try:
+                        if response.status in RETRYABLE_STATUSES:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            host.backoff(epoch, retry_after)
+                            raise RetryableError(f"HTTP {response.status}", response.status, retry_after)
+                        host.success()
+                        yield response
+                    finally:
+                        # Counted after aiohttp decompresses the body, so this is body size, not bytes on the wire
+                        metrics.inc('body_bytes_total', response.content.total_bytes, source=source)
+            except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
+                status = 'timeout'
+                host.backoff(epoch)
+                raise RetryableError(f"timed out ({type(e).__name__})") from e
+            finally:
+                # Latency covers the whole exchange, including streaming the body
+                metrics.observe('request_seconds', time.perf_counter() - started, source=source)
+                metrics.inc('requests_total', source=source, status=status)
+                await host.release()
+
+    async def _retry_transient(self, source: str, call: Callable[[], Awaitable]):
+        """Await call(), retrying with jittered backoff while it is throttled or times out"""
+        for attempt in range(self.page_retries + 1):
+            try:
+                return await call()
+            except RetryableError:
+                if attempt == self.page_retries:
+                    raise
+                self.metrics.inc('retries_total', source=source)
+                await asyncio.sleep(backoff_delay(attempt))
     
-    async def fetch_wayback_urls(self, domain: str, include_subs: bool = True) -> List[URLResult]:
-        subs = "*." if include_subs else ""
-        url = f"http://web.archive.org/cdx/search/cdx?url={subs}{domain}/*&output=json&collapse=urlkey"
+    def _decode(self, source: str, parse, lines) -> List[URLResult]:
+        """Parse a batch of lines, timing it for the per-source decode report"""
+        started = time.perf_counter()
+        results = [result for result in map(parse, lines) if result is not None]
+        self.metrics.inc('decode_seconds_total', time.perf_counter() - started, source=source)
+        self.metrics.inc('decoded_rows_total', len(results), source=source)
+        return results
+
+    async def _stream_rows(self, source: str, response, recorder, parse) -> AsyncIterator[List[URLResult]]:
+        """Parse a streamed body in batches of lines while the recorder copies it into the cache"""
+        batch = []
+        async for line in response.content:
+            recorder.feed(line)
+            batch.append(line)
+            if len(batch) >= DECODE_BATCH:
+                yield self._decode(source, parse, batch)
+                batch = []
+        yield self._decode(source, parse, batch)
+        recorder.commit()
+
+    async def _read_rows(self, source: str, response, recorder, parse) -> List[URLResult]:
+        """All rows of a streamed body, for pages that are checkpointed or retried as a whole"""
+        results = []
+        async for rows in self._stream_rows(source, response, recorder, parse):
+            results.extend(rows)
+        return results
+
+    async def _wayback_num_pages(self, query: str) -> Optional[int]:
+        """Ask CDX how many pages a query spans, None if pagination is unavailable"""
+        url = f"{WAYBACK_CDX_URL}?{query}&showNumPages=true"
+        cached = self._cache_get('wayback', url)
+
+        async def fetch():
+            async with self._request('wayback', url) as response:
+                if response.status != 200:
+                    return None
+                body = await response.read()
+                num_pages = max(int(body.decode().strip()), 1)
+                self._cache_put('wayback', url, body)
+                return num_pages
+
+        try:
+            if cached is not None:
+                return max(int(cached.decode().strip()), 1)
+            return await self._retry_transient('wayback', fetch)
+        except (ValueError, RetryableError, aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    @staticmethod
+    def _parse_cdx_fields(line: bytes) -> Optional[URLResult]:
+        """Parse one line of CDX text output trimmed to WAYBACK_FIELDS (timestamp original)"""
+        try:
+            timestamp, _, original = line.decode().rstrip('\r\n').partition(' ')
+        except UnicodeDecodeError:
+            return None
+        if not original:
+            return None
+        return URLResult(url=original, source="wayback", timestamp=timestamp)
+
+    def _cdx_parser(self, query: str):
+        return self._parse_cdx_fields if f"&fl={WAYBACK_FIELDS}" in query else self._parse_cdx_line
 
+    @staticmethod
+    def _parse_cdx_line(line: bytes) -> Optional[URLResult]:
+        """Parse one line of default CDX text output (urlkey timestamp original mimetype statuscode digest length)"""
         try:
-            async with self.session.get(url) as response:
+            fields = line.decode().rstrip('\r\n').split(' ')
+        except UnicodeDecodeError:
+            return None
+        if len(fields) < 3:
+            return None
+        # Originals are space-escaped by CDX, but join any stray spaces back rather than dropping the row
+        original = ' '.join(fields[2:-4]) if len(fields) > 7 else fields[2]
+        return URLResult(url=original, source="wayback", timestamp=fields[1])
+
+    async def _fetch_wayback_page(self, domain: str, query: str, page: Optional[int]) -> Optional[List[URLResult]]:
+        """Fetch one CDX page, parsing rows as they arrive; None means the page failed and may be retried"""
+        url = f"{WAYBACK_CDX_URL}?{query}" if page is None else f"{WAYBACK_CDX_URL}?{query}&page={page}"
+
+        parse = self._cdx_parser(query)
+        cached = self._cached_lines('wayback', url, page)
+        if cached is not None:
+            return self._decode('wayback', parse, cached)
+
+        try:
+            async with self._request('wayback', url) as response:
                 # Check HTTP status
                 if response.status != 200:
                     print(f"[Wayback] HTTP error {response.status} for domain {domain} at URL: {url}")
@@ -49,88 +279,452 @@ class URLHarvester:
                     # Print response text for more info
                     content = await response.text()
                     print(f"[Wayback] Response content:\n{content}")
-                    return []
-                
-                # Try to decode JSON
-                try:
-                    data = await response.json()
-                except Exception as json_err:
-                    content = await response.text()
-                    print(f"[Wayback] JSON decode error: {json_err}")
-                    print(f"[Wayback] Response content:\n{content}")
-                    return []
+                    return None
 
-                # Check if we got data or just header row
-                if not data or len(data) <= 1:
-                    print(f"[Wayback] No archived URLs found for {domain}")
-                    print(f"[Wayback] Raw data: {data}")
-                    return []
+                return await self._read_rows('wayback', response, self._recorder('wayback', url, page), parse)
+
+        except RetryableError as e:
+            print(f"[Wayback] {e} on page {page} for domain {domain}, backing off")
+            return None
+        except Exception as e:
+            print(f"[Wayback] Unexpected exception on page {page} for domain {domain}: {e}")
+            return None
 
-                results = []
-                # data[0] is header, iterate from 1
-                for row in data[1:]:
-                    if len(row) >= 3:
-                        results.append(URLResult(url=row[2], source="wayback", timestamp=row[1]))
+    async def _stream_wayback_query(self, domain: str, query: str) -> AsyncIterator[List[URLResult]]:
+        """The unpaginated fallback: rows in decode batches as the body arrives, not once all of it is read.
 
-                print(f"[Wayback] Retrieved {len(results)} URLs for domain {domain}")
+        A retry after a stream broke off repeats the rows already passed on;
+        the pipeline's dedupe drops them.
+        """
+        url = f"{WAYBACK_CDX_URL}?{query}"
+        parse = self._cdx_parser(query)
+        cached = self._cached_lines('wayback', url, None)
+        if cached is not None:
+            batch = []
+            for line in cached:
+                batch.append(line)
+                if len(batch) >= DECODE_BATCH:
+                    yield self._decode('wayback', parse, batch)
+                    batch = []
+            yield self._decode('wayback', parse, batch)
+            return
+
+        for attempt in range(self.page_retries + 1):
+            try:
+                async with self._request('wayback', url) as response:
+                    if response.status == 200:
+                        async for rows in self._stream_rows('wayback', response, self._recorder('wayback', url, None),
+                                                            parse):
+                            yield rows
+                        return
+                    print(f"[Wayback] HTTP error {response.status} for domain {domain} at URL: {url}")
+            except RetryableError as e:
+                print(f"[Wayback] {e} for domain {domain}, backing off")
+            except Exception as e:
+                print(f"[Wayback] Unexpected exception for domain {domain}: {e}")
+            if attempt < self.page_retries:
+                self.metrics.inc('retries_total', source='wayback')
+                await asyncio.sleep(backoff_delay(attempt))
+        self.metrics.inc('failed_pages_total', source='wayback')
+        self.failed_pages += 1
+        print(f"[Wayback] {domain}: Giving up after {self.page_retries + 1} attempts")
+
+    async def _retry_page(self, label: str, fetch_page, source: str) -> Optional[List[URLResult]]:
+        """Retry a single page fetch on its own; fetch_page returns None on failure, and so does this once attempts run out"""
+        for attempt in range(self.page_retries + 1):
+            results = await fetch_page()
+            if results is not None:
                 return results
+            if attempt < self.page_retries:
+                self.metrics.inc('retries_total', source=source)
+                await asyncio.sleep(backoff_delay(attempt))
+        self.metrics.inc('failed_pages_total', source=source)
+        print(f"{label} Giving up after {self.page_retries + 1} attempts")
+        return None
 
-        except Exception as e:
-            print(f"[Wayback] Unexpected exception for domain {domain}: {e}")
+    async def _with_retry(self, label: str, fetch_page, unit: Optional[tuple] = None) -> List[URLResult]:
+        """Retry a single page fetch, counting pages that never succeed as failed.
+
+        unit is the (domain, source, page key) checkpointed in the job journal:
+        pages finished by an earlier run are skipped, since the journal replays
+        their rows, and a page is only journaled once it succeeds.
+        """
+        if unit and self.journal and self.journal.is_done(*unit):
+            return []
+        results = await self._retry_page(label, fetch_page, unit[1] if unit else 'unknown')
+        if results is None:
+            self.failed_pages += 1
             return []
+        if unit and self.journal:
+            self.journal.record(*unit, results)
+        return results
+
+    async def _fetch_wayback_page_with_retry(self, domain: str, query: str, page: Optional[int]) -> List[URLResult]:
+        return await self._with_retry(
+            f"[Wayback] page {page} for {domain}:",
+            lambda: self._fetch_wayback_page(domain, query, page),
+            (domain, 'wayback', f"cdx:{'all' if page is None else page}")
+        )
+
+    async def _iter_pages(self, fetches: Iterable[Callable[[], Awaitable[List[URLResult]]]]) -> AsyncIterator[List[URLResult]]:
+        """Run page fetches with at most page_concurrency in flight, yielding each page in order as soon as it is ready"""
+        pending = deque()
+        try:
+            for fetch in fetches:
+                pending.append(asyncio.ensure_future(fetch()))
+                if len(pending) >= self.page_concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _wayback_query(self, domain: str, include_subs: bool, since: Optional[str] = None,
+                       start: Optional[int] = None, end: Optional[int] = None, filters: Iterable[str] = ()) -> str:
+        subs = "*." if include_subs else ""
+        query = f"url={subs}{domain}/*&collapse=urlkey" + _date_bounds(since, start, end)
+        if self.pushdown:
+            query += f"&fl={WAYBACK_FIELDS}"
+            query += ''.join(f"&filter={quote(cdx_filter, safe='')}" for cdx_filter in filters)
+        return query
+
+    async def _wayback_pages(self, query: str) -> List[Optional[int]]:
+        num_pages = await self._wayback_num_pages(query)
+        # Fall back to a single unpaginated query when CDX cannot paginate
+        return [None] if num_pages is None else list(range(num_pages))
+
+    async def iter_wayback_urls(self, domain: str, include_subs: bool = True, since: Optional[str] = None,
+                                start: Optional[int] = None, end: Optional[int] = None,
+                                filters: Iterable[str] = ()) -> AsyncIterator[URLResult]:
+        """Stream URLs from the Wayback Machine, only snapshots newer than since and within start..end when given.
+
+        filters are CDX filter= values (see URLFilter.cdx_filters) applied by the archive.
+        """
+        query = self._wayback_query(domain, include_subs, since, start, end, filters)
+        pages = await self._wayback_pages(query)
+        if pages == [None] and not self.journal:
+            # Nothing to checkpoint page by page, so rows are passed on while the one big response downloads
+            batches = self._stream_wayback_query(domain, query)
+        else:
+            batches = self._iter_pages(
+                functools.partial(self._fetch_wayback_page_with_retry, domain, query, page)
+                for page in pages
+            )
+
+        since_value = timestamp_to_int(since)
+        count = 0
+        async for page_results in batches:
+            for result in page_results:
+                # CDX "from" bounds are inclusive, drop the rows we already reported last run
+                if since_value and result.timestamp_value <= since_value:
+                    continue
+                count += 1
+                yield result
+
+        if count:
+            print(f"[Wayback] Retrieved {count} URLs for domain {domain}")
+        else:
+            print(f"[Wayback] No archived URLs found for {domain}")
+
+    async def fetch_wayback_urls(self, domain: str, include_subs: bool = True, since: Optional[str] = None,
+                                 start: Optional[int] = None, end: Optional[int] = None,
+                                 filters: Iterable[str] = ()) -> List[URLResult]:
+        """Fetch URLs from the Wayback Machine, merged in page order"""
+        return [result async for result in self.iter_wayback_urls(domain, include_subs, since, start, end, filters)]
 
     
-    async def fetch_commoncrawl_urls(self, domain: str, include_subs: bool = True) -> List[URLResult]:
-        """Fetch URLs from Common Crawl"""
-        subdomain_prefix = "*." if include_subs else ""
-        url = f"http://index.commoncrawl.org/CC-MAIN-2018-22-index?url={subdomain_prefix}{domain}/*&output=json"
-        
+    async def _commoncrawl_collections(self) -> List[Dict]:
+        """Available Common Crawl collections, newest first, loaded once per session"""
+        async with self._cc_collections_lock:
+            if self._cc_collections is None:
+                url = f"{COMMONCRAWL_INDEX_URL}/collinfo.json"
+                cached = self._cache_get('commoncrawl-collinfo', url)
+                if cached is not None:
+                    self._cc_collections = self._loads(cached)
+                    return self._cc_collections
+
+                async def fetch():
+                    async with self._request('commoncrawl', url) as response:
+                        if response.status != 200:
+                            print(f"[CommonCrawl] HTTP error {response.status} loading collection list")
+                            return None
+                        return await response.read()
+
+                try:
+                    body = await self._retry_transient('commoncrawl', fetch)
+                    if body is None:
+                        return []
+                    self._cc_collections = self._loads(body)
+                    self._cache_put('commoncrawl-collinfo', url, body)
+                except Exception as e:
+                    print(f"[CommonCrawl] Could not load collection list: {e}")
+                    return []
+        return self._cc_collections
+
+    def _select_commoncrawl_indexes(self, collections: List[Dict]) -> List[Dict]:
+        """Pick collections by the cc_indexes spec: all, latest:N, YYYY-YYYY or a comma list of ids"""
+        spec = self.cc_indexes
+        if spec == 'all':
+            return collections
+        if spec.startswith('latest'):
+            _, _, count = spec.partition(':')
+            return collections[:int(count or 1)]
+        window = re.match(r'^(\d{4})-(\d{4})$', spec)
+        if window:
+            first, last = int(window.group(1)), int(window.group(2))
+            selected = []
+            for collection in collections:
+                year = re.match(r'CC-MAIN-(\d{4})', collection.get('id', ''))
+                if year and first <= int(year.group(1)) <= last:
+                    selected.append(collection)
+            return selected
+        wanted = {index.strip() for index in spec.split(',') if index.strip()}
+        return [collection for collection in collections if collection.get('id') in wanted]
+
+    def _parse_commoncrawl_line(self, line: bytes) -> Optional[URLResult]:
         try:
-            async with self.session.get(url) as response:
+            data = self._loads(line)
+        except ValueError:
+            # Malformed JSON and invalid UTF-8, from either decoder
+            return None
+        return URLResult(
+            url=data.get('url', ''),
+            source="commoncrawl",
+            timestamp=data.get('timestamp', '')
+        )
+
+    @staticmethod
+    def _collection_end(collection: Dict) -> str:
+        """Last capture time of a collection as YYYYMMDDhhmmss, derived from its id if collinfo lacks it"""
+        if collection.get('to'):
+            return re.sub(r'\D', '', collection['to'])[:14]
+        match = re.match(r'CC-MAIN-(\d{4})-(\d{2})', collection.get('id', ''))
+        if not match:
+            return '99999999999999'
+        try:
+            end = datetime.fromisocalendar(int(match.group(1)), int(match.group(2)), 7)
+        except ValueError:
+            return '99999999999999'
+        return end.strftime('%Y%m%d') + '235959'
+
+    @classmethod
+    def _collection_start(cls, collection: Dict) -> str:
+        """First capture time of a collection; crawls run for a few weeks, so without collinfo 'from' assume a month"""
+        if collection.get('from'):
+            return re.sub(r'\D', '', collection['from'])[:14]
+        end = cls._collection_end(collection)
+        if end == '99999999999999':
+            return '00000000000000'
+        return (datetime.strptime(end[:8], '%Y%m%d') - timedelta(days=31)).strftime('%Y%m%d') + '000000'
+
+    async def _commoncrawl_num_pages(self, api: str, query: str) -> Optional[int]:
+        url = f"{api}?{query}&showNumPages=true"
+        cached = self._cache_get('commoncrawl', url)
+
+        async def fetch():
+            async with self._request('commoncrawl', url) as response:
                 if response.status != 200:
+                    return None
+                body = await response.read()
+                num_pages = max(int(self._loads(body).get('pages', 1)), 1)
+                self._cache_put('commoncrawl', url, body)
+                return num_pages
+
+        try:
+            if cached is not None:
+                return max(int(self._loads(cached).get('pages', 1)), 1)
+            return await self._retry_transient('commoncrawl', fetch)
+        except Exception:
+            return None
+
+    async def _fetch_commoncrawl_page(self, domain: str, api: str, query: str,
+                                      page: Optional[int]) -> Optional[List[URLResult]]:
+        """Fetch one index page as JSON lines; None means the page failed and may be retried"""
+        url = f"{api}?{query}" if page is None else f"{api}?{query}&page={page}"
+
+        cached = self._cached_lines('commoncrawl', url, page)
+        if cached is not None:
+            return self._decode('commoncrawl', self._parse_commoncrawl_line, cached)
+
+        try:
+            async with self._request('commoncrawl', url) as response:
+                # The index server answers 404 when a query has no captures
+                if response.status == 404:
                     return []
-                
-                results = []
-                async for line in response.content:
-                    try:
-                        data = json.loads(line.decode())
-                        results.append(URLResult(
-                            url=data.get('url', ''),
-                            source="commoncrawl",
-                            timestamp=data.get('timestamp', '')
-                        ))
-                    except (json.JSONDecodeError, UnicodeDecodeError):
-                        continue
-                
-                return results
+                if response.status != 200:
+                    print(f"[CommonCrawl] HTTP error {response.status} for domain {domain} at URL: {url}")
+                    return None
+
+                return await self._read_rows('commoncrawl', response, self._recorder('commoncrawl', url, page),
+                                             self._parse_commoncrawl_line)
+        except RetryableError as e:
+            print(f"[CommonCrawl] {e} on page {page} for domain {domain}, backing off")
+            return None
         except Exception as e:
-            print(f"Error fetching CommonCrawl URLs for {domain}: {e}")
-            return []
+            print(f"[CommonCrawl] Unexpected exception on page {page} for domain {domain}: {e}")
+            return None
+
+    async def _fetch_commoncrawl_page_with_retry(self, domain: str, collection: Dict, query: str,
+                                                 page: Optional[int]) -> List[URLResult]:
+        return await self._with_retry(
+            f"[CommonCrawl] {collection['id']} page {page} for {domain}:",
+            lambda: self._fetch_commoncrawl_page(domain, collection['cdx-api'], query, page),
+            (domain, 'commoncrawl', f"{collection['id']}:{'all' if page is None else page}")
+        )
+
+    def _commoncrawl_query(self, domain: str, include_subs: bool, since: Optional[str] = None,
+                           start: Optional[int] = None, end: Optional[int] = None) -> str:
+        subdomain_prefix = "*." if include_subs else ""
+        query = f"url={subdomain_prefix}{domain}/*&output=json" + _date_bounds(since, start, end)
+        if self.pushdown:
+            query += f"&fl={COMMONCRAWL_FIELDS}"
+        return query
+
+    async def _commoncrawl_pages(self, query: str, since: Optional[str] = None,
+                                 start: Optional[int] = None, end: Optional[int] = None) -> List[tuple]:
+        """(collection, page) pairs to fetch for a query, newest index first"""
+        indexes = self._select_commoncrawl_indexes(await self._commoncrawl_collections())
+        # Skip crawls that finished before the last run or the window, or began after it;
+        # the query bounds captures in the remaining ones server-side
+        after = max(timestamp_to_int(since), start or 0)
+        if after:
+            indexes = [collection for collection in indexes if int(self._collection_end(collection)) > after]
+        if end:
+            indexes = [collection for collection in indexes if int(self._collection_start(collection)) <= end]
+        window = asyncio.Semaphore(self.page_concurrency)
+
+        async def index_pages(collection):
+            async with window:
+                num_pages = await self._commoncrawl_num_pages(collection['cdx-api'], query)
+            if num_pages is None:
+                return [(collection, None)]
+            if self.cc_max_pages:
+                num_pages = min(num_pages, self.cc_max_pages)
+            return [(collection, page) for page in range(num_pages)]
+
+        per_index = await asyncio.gather(*(index_pages(collection) for collection in indexes))
+        return [pair for pairs in per_index for pair in pairs]
+
+    async def iter_commoncrawl_urls(self, domain: str, include_subs: bool = True, since: Optional[str] = None,
+                                    start: Optional[int] = None, end: Optional[int] = None) -> AsyncIterator[URLResult]:
+        """Stream URLs from the selected Common Crawl indexes, only captures newer than since and within start..end"""
+        query = self._commoncrawl_query(domain, include_subs, since, start, end)
+        pages = await self._commoncrawl_pages(query, since, start, end)
+        if not pages:
+            return
+        fetches = (
+            functools.partial(self._fetch_commoncrawl_page_with_retry, domain, collection, query, page)
+            for collection, page in pages
+        )
+
+        # Newest index first; the same URL from several indexes is deduplicated downstream, within its memory budget
+        since_value = timestamp_to_int(since)
+        async for page_results in self._iter_pages(fetches):
+            for result in page_results:
+                if since_value and result.timestamp_value <= since_value:
+                    continue
+                if result.url:
+                    yield result
+
+    async def fetch_commoncrawl_urls(self, domain: str, include_subs: bool = True, since: Optional[str] = None,
+                                     start: Optional[int] = None, end: Optional[int] = None) -> List[URLResult]:
+        """Fetch URLs from the selected Common Crawl indexes"""
+        return [result async for result in self.iter_commoncrawl_urls(domain, include_subs, since, start, end)]
     
+    async def plan_units(self, domain: str, include_subs: bool = True,
+                         sources: Iterable[str] = ('wayback', 'commoncrawl', 'virustotal'),
+                         start: Optional[int] = None, end: Optional[int] = None,
+                         filters: Iterable[str] = ()) -> List[Dict]:
+        """Split a domain into independent work units: one per CDX page, Common Crawl index page and VirusTotal report.
+
+        Each unit is a JSON-serialisable dict whose 'unit' key matches the job
+        journal's page keys; fetch_unit() runs it on any harvester.
+        """
+        units = []
+        if 'wayback' in sources:
+            query = self._wayback_query(domain, include_subs, start=start, end=end, filters=filters)
+            for page in await self._wayback_pages(query):
+                units.append({'domain': domain, 'source': 'wayback', 'unit': f"cdx:{'all' if page is None else page}",
+                              'query': query, 'page': page})
+        if 'commoncrawl' in sources:
+            query = self._commoncrawl_query(domain, include_subs, start=start, end=end)
+            for collection, page in await self._commoncrawl_pages(query, start=start, end=end):
+                units.append({'domain': domain, 'source': 'commoncrawl',
+                              'unit': f"{collection['id']}:{'all' if page is None else page}",
+                              'query': query, 'page': page, 'index': collection['id'], 'api': collection['cdx-api']})
+        # VirusTotal rows carry no timestamp, so a date window would drop them all
+        if 'virustotal' in sources and not (start or end):
+            units.append({'domain': domain, 'source': 'virustotal', 'unit': 'report'})
+        return units
+
+    async def fetch_unit(self, unit: Dict) -> Optional[List[URLResult]]:
+        """Rows of one unit from plan_units(); None when the page still failed after retries"""
+        domain, source, page = unit['domain'], unit['source'], unit.get('page')
+        if source == 'wayback':
+            return await self._retry_page(f"[Wayback] page {page} for {domain}:",
+                                          lambda: self._fetch_wayback_page(domain, unit['query'], page), source)
+        if source == 'commoncrawl':
+            return await self._retry_page(f"[CommonCrawl] {unit['index']} page {page} for {domain}:",
+                                          lambda: self._fetch_commoncrawl_page(domain, unit['api'], unit['query'], page),
+                                          source)
+        if source == 'virustotal':
+            if not os.getenv('VT_API_KEY'):
+                print(f"[VirusTotal] VT_API_KEY is not set; leaving the report for {domain} to another worker")
+                return None
+            return await self._fetch_virustotal_report(domain)
+        raise ValueError(f"Unknown source: {source}")
+
+    async def iter_virustotal_urls(self, domain: str) -> AsyncIterator[URLResult]:
+        for result in await self.fetch_virustotal_urls(domain):
+            yield result
+
     async def fetch_virustotal_urls(self, domain: str) -> List[URLResult]:
-        """Fetch URLs from VirusTotal (requires API key)"""
+        """Fetch URLs from VirusTotal (requires API key); nothing when the key is missing or the report failed"""
+        if not os.getenv('VT_API_KEY'):
+            return []
+        return await self._fetch_virustotal_report(domain) or []
+
+    async def _fetch_virustotal_report(self, domain: str) -> Optional[List[URLResult]]:
+        """URLs in a domain's VirusTotal report; None when it could not be fetched or read"""
         api_key = os.getenv('VT_API_KEY')
-        if not api_key:
+        if self.journal and self.journal.is_done(domain, 'virustotal', 'report'):
             return []
         
-        url = f"https://www.virustotal.com/vtapi/v2/domain/report?apikey={api_key}&domain={domain}"
+        url = f"{VIRUSTOTAL_REPORT_URL}?apikey={api_key}&domain={domain}"
         
         try:
-            async with self.session.get(url) as response:
-                if response.status != 200:
-                    return []
-                
-                data = await response.json()
-                results = []
-                
-                for url_data in data.get('detected_urls', []):
-                    results.append(URLResult(
-                        url=url_data.get('url', ''),
-                        source="virustotal"
-                    ))
-                
-                return results
+            # Cache under the domain rather than the URL so the API key never reaches disk
+            cache_url = f"virustotal:{domain}"
+            body = self._cache_get('virustotal', cache_url)
+            if body is None:
+                async def fetch():
+                    async with self._request('virustotal', url) as response:
+                        if response.status != 200:
+                            return None
+                        return await response.read()
+
+                body = await self._retry_transient('virustotal', fetch)
+                if body is None:
+                    return None
+                self._cache_put('virustotal', cache_url, body)
+            
+            started = time.perf_counter()
+            data = self._loads(body)
+            results = []
+            
+            for url_data in data.get('detected_urls', []):
+                results.append(URLResult(
+                    url=url_data.get('url', ''),
+                    source="virustotal"
+                ))
+            self.metrics.inc('decode_seconds_total', time.perf_counter() - started, source='virustotal')
+            self.metrics.inc('decoded_rows_total', len(results), source='virustotal')
+
+            if self.journal:
+                self.journal.record(domain, 'virustotal', 'report', results)
+            return results
         except Exception as e:
             print(f"Error fetching VirusTotal URLs for {domain}: {e}")
-            return []
+            return None
 
@@ -0,0 +1,108 @@
+# core/journal.py
+import json
+import os
+from typing import Dict, Iterator, List, Set, Tuple
+
+from .records import URLResult
+
+class HarvestJournal:
+    """Checkpoint of a harvest job: finished (domain, source, page) units and the rows they produced.
+
+    Rows of a unit are appended to rows.jsonl and flushed before the unit is
+    marked complete in units.jsonl, together with the rows file size at that
+    point. On resume the rows file is cut back to the last completed unit, so
+    rows of a page that was interrupted half-way are never replayed twice.
+    """
+
+    def __init__(self, directory: str, resume: bool = False):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'job.json')
+        self.units_path = os.path.join(directory, 'units.jsonl')
+        self.rows_path = os.path.join(directory, 'rows.jsonl')
+        self.meta: Dict = {}
+        self.completed: Set[Tuple[str, str, str]] = set()
+        self.replayed_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if not resume and os.path.exists(self.units_path):
+            raise ValueError(f"{directory} already holds a harvest job; pass --resume or choose another directory")
+        if resume:
+            if not os.path.exists(self.meta_path):
+                raise ValueError(f"No harvest job to resume in {directory}")
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+            self._recover()
+
+        # Only rows that existed before this run are replayed; new ones reach the output directly
+        self._replay_end = os.path.getsize(self.rows_path) if resume and os.path.exists(self.rows_path) else 0
+        mode = 'a' if resume else 'w'
+        self._units = open(self.units_path, mode, encoding='utf-8')
+        self._rows = open(self.rows_path, mode, encoding='utf-8')
+
+    def _recover(self):
+        """Load completed units and drop anything written after the last one"""
+        rows_end = 0
+        units_end = 0
+        if os.path.exists(self.units_path):
+            with open(self.units_path, 'rb') as f:
+                for line in f:
+                    try:
+                        unit = json.loads(line)
+                    except ValueError:
+                        break  # torn final line from a crash
+                    if not line.endswith(b'\n'):
+                        break
+                    self.completed.add((unit['domain'], unit['source'], unit['unit']))
+                    rows_end = unit['end']
+                    units_end += len(line)
+            with open(self.units_path, 'r+b') as f:
+                f.truncate(units_end)
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path, 'r+b') as f:
+                f.truncate(rows_end)
+
+    def save_meta(self, **meta):
+        """Record the job's parameters so --resume can restore them"""
+        self.meta.update(meta)
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+    def is_done(self, domain: str, source: str, unit: str) -> bool:
+        return (domain, source, unit) in self.completed
+
+    def record(self, domain: str, source: str, unit: str, results: List[URLResult]):
+        """Persist a finished unit's rows, then mark the unit complete"""
+        rows = self._rows
+        for result in results:
+            rows.write(json.dumps([result.url, result.source, result.timestamp_value, result.status_code]) + '\n')
+        rows.flush()
+        os.fsync(rows.fileno())
+        self._units.write(json.dumps({'domain': domain, 'source': source, 'unit': unit, 'end': rows.tell()}) + '\n')
+        self._units.flush()
+        self.completed.add((domain, source, unit))
+
+    def replay(self) -> Iterator[URLResult]:
+        """Rows saved by earlier runs of this job"""
+        if not self._replay_end:
+            return
+        with open(self.rows_path, 'rb') as f:
+            remaining = self._replay_end
+            for line in f:
+                remaining -= len(line)
+                if remaining < 0:
+                    break
+                url, source, timestamp, status_code = json.loads(line)
+                self.replayed_rows += 1
+                yield URLResult(url, source, timestamp, status_code)
+
+    def close(self):
+        self._units.close()
+        self._rows.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,226 @@
+# core/metrics.py
+import contextlib
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds for request latency histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _label_text(labels: Labels) -> str:
+    return ','.join(f"{key}={value}" for key, value in labels)
+
+def _series_dict(series: Dict[Labels, object]):
+    """Series keyed by their label text; a lone unlabelled series is reported as a bare value"""
+    if list(series) == [()]:
+        return series[()]
+    return {_label_text(key): value for key, value in series.items()}
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process, None where the resource module is unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus style (cumulative counts per upper bound)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self) -> Dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+class MetricsRegistry:
+    """Counters, gauges and histograms for one run, exported as JSON or Prometheus text"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def record_stage(self, name: str, rows: int, seconds: float):
+        stage = self.stages.setdefault(name, {'rows': 0, 'seconds': 0.0})
+        stage['rows'] += rows
+        stage['seconds'] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """Time a pipeline stage; set the yielded dict's 'rows' to the number of rows it processed"""
+        stage = {'rows': 0}
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            self.record_stage(name, stage['rows'], time.perf_counter() - start)
+
+    def finish(self):
+        """Record run-level gauges; call once before exporting"""
+        self.set('run_duration_seconds', round(time.time() - self.started, 3))
+        rss = peak_rss_bytes()
+        if rss is not None:
+            self.set('peak_rss_bytes', rss)
+
+    def as_dict(self) -> Dict:
+        stages = {}
+        for name, stage in self.stages.items():
+            seconds = stage['seconds']
+            stages[name] = {
+                'rows': int(stage['rows']),
+                'seconds': round(seconds, 6),
+                'rows_per_second': round(stage['rows'] / seconds, 1) if seconds else None,
+            }
+        return {
+            'started_at': datetime.fromtimestamp(self.started).isoformat(),
+            'stages': stages,
+            'counters': {name: _series_dict(series) for name, series in self.counters.items()},
+            'gauges': {name: _series_dict(series) for name, series in self.gauges.items()},
+            'histograms': {name: _series_dict({key: histogram.as_dict() for key, histogram in series.items()})
+                           for name, series in self.histograms.items()},
+        }
+
+    def to_prometheus(self, prefix: str = 'pybackurls_') -> str:
+        lines: List[str] = []
+
+        def series_name(name: str, labels: Labels, extra: Labels = ()) -> str:
+            labels = labels + extra
+            if not labels:
+                return prefix + name
+            body = ','.join(f'{key}="{value}"' for key, value in labels)
+            return f"{prefix}{name}{{{body}}}"
+
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE {prefix}{name} counter")
+            lines.extend(f"{series_name(name, key)} {value}" for key, value in series.items())
+        for name, series in self.gauges.items():
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.extend(f"{series_name(name, key)} {value}" for key, value in series.items())
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for key, histogram in series.items():
+                for bound, count in histogram.as_dict()['buckets'].items():
+                    lines.append(f"{series_name(name + '_bucket', key, (('le', bound),))} {count}")
+                lines.append(f"{series_name(name + '_sum', key)} {histogram.sum}")
+                lines.append(f"{series_name(name + '_count', key)} {histogram.count}")
+        if self.stages:
+            lines.append(f"# TYPE {prefix}stage_rows_total counter")
+            for name, stage in self.stages.items():
+                lines.append(f"{series_name('stage_rows_total', (('stage', name),))} {int(stage['rows'])}")
+            lines.append(f"# TYPE {prefix}stage_seconds_total counter")
+            for name, stage in self.stages.items():
+                lines.append(f"{series_name('stage_seconds_total', (('stage', name),))} {stage['seconds']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def write_prometheus(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+
+class RunProfiler:
+    """Wraps a run in cProfile or tracemalloc and writes the dump when stopped"""
+
+    def __init__(self, mode: str, path: str):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self._profile = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            import tracemalloc
+            tracemalloc.start(25)
+
+    def stop(self) -> str:
+        """Stop profiling, write the dump and return its path"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.mode == 'cprofile':
+            self._profile.disable()
+            # Load with pstats.Stats(path) or snakeviz
+            self._profile.dump_stats(self.path)
+            return self.path
+
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(f"# traced memory: current {current} bytes, peak {peak} bytes\n")
+            for stat in snapshot.statistics('traceback')[:25]:
+                f.write(f"\n{stat.size} bytes in {stat.count} blocks\n")
+                f.write('\n'.join(stat.traceback.format()) + '\n')
+        return self.path
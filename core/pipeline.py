@@ -0,0 +1,32 @@
+# core/pipeline.py
+from typing import AsyncIterator, Callable, Hashable, Optional
+
+from .dedupe import Deduplicator
+from .harvester import URLResult
+
+async def filter_stage(results: AsyncIterator[URLResult],
+                       stage: Callable[[URLResult], Optional[URLResult]]) -> AsyncIterator[URLResult]:
+    """Pass each result through stage, dropping the ones it rejects with None"""
+    async for result in results:
+        kept = stage(result)
+        if kept is not None:
+            yield kept
+
+async def dedupe_stage(results: AsyncIterator[URLResult],
+                       key: Callable[[URLResult], Hashable] = lambda result: result.url,
+                       seen: Optional[Deduplicator] = None) -> AsyncIterator[URLResult]:
+    """Yield only the first result for each key"""
+    seen = seen if seen is not None else Deduplicator()
+    try:
+        async for result in results:
+            if seen.add(key(result)):
+                yield result
+    finally:
+        seen.close()
+
+async def tap_stage(results: AsyncIterator[URLResult],
+                    callback: Callable[[URLResult], None]) -> AsyncIterator[URLResult]:
+    """Call callback on every result without changing the stream"""
+    async for result in results:
+        callback(result)
+        yield result
@@ -0,0 +1,133 @@
+# core/ratelimit.py
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# Statuses that mean "slow down / try again later" rather than a real failure
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+# Never honour a Retry-After longer than this many seconds
+MAX_RETRY_AFTER = 300.0
+
+class RetryableError(Exception):
+    """A request was throttled or timed out and can be retried after backing off"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), None if absent or invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), MAX_RETRY_AFTER)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return min(max((when - datetime.now(timezone.utc)).total_seconds(), 0.0), MAX_RETRY_AFTER)
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter, so clients that failed together do not retry together"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class TokenBucket:
+    """Requests per second with bursts up to capacity; can be paused outright for a Retry-After"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HostLimiter:
+    """Token bucket plus an AIMD concurrency window for one host.
+
+    Every success widens the window by about one request per round trip, and
+    a 429, 503 or timeout halves it. Only the first failure among requests
+    started under the same window size shrinks it, so a burst of failures
+    from one overload cuts it once rather than collapsing it to the minimum.
+    """
+
+    def __init__(self, rate: float, initial: int = 4, minimum: int = 1, maximum: int = 32):
+        self.bucket = TokenBucket(rate)
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.epoch = 0
+        self.successes = 0
+        self.backoffs = 0
+        self._ready = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Wait for a window slot and a token; returns the epoch to report the outcome against"""
+        async with self._ready:
+            await self._ready.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            await self.bucket.take()
+        except BaseException:
+            # Cancelled while waiting for a token: give the slot back
+            await self.release()
+            raise
+        return self.epoch
+
+    async def release(self):
+        # Free the slot before waiting on the lock, so a cancellation here cannot leak it
+        self.in_flight -= 1
+        async with self._ready:
+            self._ready.notify_all()
+
+    def success(self):
+        self.successes += 1
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def backoff(self, epoch: int, retry_after: Optional[float] = None):
+        self.backoffs += 1
+        if retry_after:
+            self.bucket.pause(retry_after)
+        if epoch == self.epoch:
+            self.epoch += 1
+            self.limit = max(float(self.minimum), self.limit / 2)
+
+class RateLimiter:
+    """Per-host limiters shared by every request in a session"""
+
+    def __init__(self, rate: float = 10.0, initial_concurrency: int = 4, max_concurrency: int = 32):
+        self.rate = rate
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.hosts: Dict[str, HostLimiter] = {}
+
+    def for_url(self, url: str) -> HostLimiter:
+        host = urlsplit(url).hostname or ''
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.rate, self.initial_concurrency, maximum=self.max_concurrency)
+        return self.hosts[host]
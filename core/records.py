@@ -0,0 +1,127 @@
+# core/records.py
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Source names are stored once and referenced by a small integer id from every row
+_SOURCE_NAMES: List[str] = ['wayback', 'commoncrawl', 'virustotal']
+_SOURCE_IDS: Dict[str, int] = {name: index for index, name in enumerate(_SOURCE_NAMES)}
+
+def source_id(name: str) -> int:
+    """Interned id for a source name, registering new names on first use"""
+    try:
+        return _SOURCE_IDS[name]
+    except KeyError:
+        if len(_SOURCE_NAMES) >= 255:
+            raise ValueError("Too many distinct sources")
+        _SOURCE_IDS[name] = len(_SOURCE_NAMES)
+        _SOURCE_NAMES.append(name)
+        return _SOURCE_IDS[name]
+
+def source_name(source: int) -> str:
+    return _SOURCE_NAMES[source]
+
+def timestamp_to_int(timestamp) -> int:
+    """Archive timestamp (YYYYMMDDhhmmss, possibly truncated) as a 14-digit integer, 0 when missing"""
+    if not timestamp:
+        return 0
+    if isinstance(timestamp, int):
+        return timestamp
+    digits = timestamp[:14]
+    if not digits.isdigit():
+        return 0
+    return int(digits.ljust(14, '0'))
+
+class URLResult:
+    """One harvested row: slotted, with an interned source id and an integer timestamp"""
+
+    __slots__ = ('url', 'source_id', 'timestamp_value', 'status_code')
+
+    def __init__(self, url: str, source: str, timestamp="", status_code: Optional[int] = None):
+        self.url = url
+        self.source_id = source_id(source)
+        self.timestamp_value = timestamp_to_int(timestamp)
+        self.status_code = status_code
+
+    @property
+    def source(self) -> str:
+        return _SOURCE_NAMES[self.source_id]
+
+    @source.setter
+    def source(self, name: str):
+        self.source_id = source_id(name)
+
+    @property
+    def timestamp(self) -> str:
+        """The timestamp as 14 digits; a truncated one comes back zero-padded, a malformed one empty"""
+        return str(self.timestamp_value) if self.timestamp_value else ""
+
+    @timestamp.setter
+    def timestamp(self, timestamp):
+        self.timestamp_value = timestamp_to_int(timestamp)
+
+    def __eq__(self, other):
+        if not isinstance(other, URLResult):
+            return NotImplemented
+        return (self.url, self.source_id, self.timestamp_value, self.status_code) == \
+            (other.url, other.source_id, other.timestamp_value, other.status_code)
+
+    def __repr__(self):
+        return (f"URLResult(url={self.url!r}, source={self.source!r}, "
+                f"timestamp={self.timestamp!r}, status_code={self.status_code!r})")
+
+class URLBatch:
+    """Columnar container for many rows: a URL list plus packed source, timestamp and status arrays"""
+
+    def __init__(self, results: Iterable[URLResult] = ()):
+        self.urls: List[str] = []
+        self.sources = array('B')
+        self.timestamps = array('q')
+        # 0 stands for "no status code"
+        self.status_codes = array('H')
+        self.extend(results)
+
+    def append(self, result: URLResult):
+        self.append_row(result.url, result.source_id, result.timestamp_value, result.status_code)
+
+    def append_row(self, url: str, source: int, timestamp: int, status_code: Optional[int] = None):
+        self.urls.append(url)
+        self.sources.append(source)
+        self.timestamps.append(timestamp)
+        self.status_codes.append(status_code or 0)
+
+    def extend(self, results: Iterable[URLResult]):
+        for result in results:
+            self.append(result)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def __getitem__(self, index: int) -> URLResult:
+        result = URLResult(self.urls[index], 'wayback')
+        result.source_id = self.sources[index]
+        result.timestamp_value = self.timestamps[index]
+        result.status_code = self.status_codes[index] or None
+        return result
+
+    def __iter__(self) -> Iterator[URLResult]:
+        """Materialise rows one at a time; prefer the columns or rows() in hot loops"""
+        for index in range(len(self.urls)):
+            yield self[index]
+
+    def rows(self) -> Iterator[Tuple[str, str, str, Optional[int]]]:
+        """(url, source, timestamp, status_code) per row, without building URLResult objects"""
+        names = _SOURCE_NAMES
+        for url, source, timestamp, status in zip(self.urls, self.sources, self.timestamps, self.status_codes):
+            yield url, names[source], str(timestamp) if timestamp else "", status or None
+
+def iter_urls(url_results) -> Iterable[str]:
+    """URL column of a URLBatch, or the url attribute of each result in any other iterable"""
+    if isinstance(url_results, URLBatch):
+        return url_results.urls
+    return (result.url for result in url_results)
+
+def iter_rows(url_results) -> Iterator[Tuple[str, str, str, Optional[int]]]:
+    """(url, source, timestamp, status_code) tuples from a URLBatch or an iterable of URLResult"""
+    if isinstance(url_results, URLBatch):
+        return url_results.rows()
+    return ((result.url, result.source, result.timestamp, result.status_code) for result in url_results)
@@ -0,0 +1,107 @@
+# core/scheduler.py
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+
+from .harvester import URLHarvester, URLResult
+from .records import URLBatch
+from .state import HarvestState
+
+SOURCES = ('wayback', 'commoncrawl', 'virustotal')
+
+class HarvestScheduler:
+    """Runs every source fetch for many domains concurrently inside one harvester session"""
+
+    def __init__(self, harvester: URLHarvester, max_domains: int = 10,
+                 include_subs: bool = False, sources: Iterable[str] = SOURCES,
+                 state: Optional[HarvestState] = None, start: Optional[int] = None, end: Optional[int] = None,
+                 cdx_filters: Iterable[str] = ()):
+        """start and end are 14-digit archive timestamps bounding the captures asked of each archive;
+        cdx_filters are CDX filter= values the Wayback Machine applies before sending rows"""
+        self.harvester = harvester
+        self.state = state
+        self.max_domains = max(1, max_domains)
+        self.include_subs = include_subs
+        self.sources = tuple(sources)
+        self.start = start
+        self.end = end
+        self.cdx_filters = tuple(cdx_filters)
+
+    def _iter_source(self, source: str, domain: str, since: Optional[str]) -> AsyncIterator[URLResult]:
+        if source == 'wayback':
+            return self.harvester.iter_wayback_urls(domain, self.include_subs, since=since,
+                                                    start=self.start, end=self.end, filters=self.cdx_filters)
+        if source == 'commoncrawl':
+            return self.harvester.iter_commoncrawl_urls(domain, self.include_subs, since=since,
+                                                        start=self.start, end=self.end)
+        if source == 'virustotal':
+            return self.harvester.iter_virustotal_urls(domain)
+        raise ValueError(f"Unknown source: {source}")
+
+    async def _stream_source(self, source: str, domain: str) -> AsyncIterator[URLResult]:
+        """Stream one source for one domain, recording the newest timestamp in the incremental state"""
+        since = self.state.since(domain, source) if self.state else None
+        # VirusTotal rows carry no timestamp, so incremental runs only report them the first time
+        if source == 'virustotal' and self.state and self.state.seen_before(domain):
+            return
+        # For the same reason a date window would drop every VirusTotal row; skip the request
+        if source == 'virustotal' and (self.start or self.end):
+            return
+        newest = 0
+        async for result in self._iter_source(source, domain, since):
+            if result.timestamp_value > newest:
+                newest = result.timestamp_value
+            yield result
+        if self.state and newest:
+            self.state.update(domain, source, (str(newest),))
+
+    async def collect(self, domains: List[str],
+                      on_source_done: Optional[Callable[[str, str, int], None]] = None) -> URLBatch:
+        """Harvest all domains into one columnar batch, in arrival order"""
+        batch = URLBatch()
+        async for result in self.stream(domains, on_source_done=on_source_done):
+            batch.append(result)
+        return batch
+
+    async def stream(self, domains: List[str],
+                     on_source_done: Optional[Callable[[str, str, int], None]] = None,
+                     buffer_size: int = 10000) -> AsyncIterator[URLResult]:
+        """Yield results as they arrive from every source, with at most max_domains in flight"""
+        results: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        pending = deque(domains)
+        done = object()
+
+        async def pump(source, domain):
+            count = 0
+            async for result in self._stream_source(source, domain):
+                await results.put(result)
+                count += 1
+            if on_source_done:
+                on_source_done(domain, source, count)
+
+        async def worker():
+            while pending:
+                domain = pending.popleft()
+                await asyncio.gather(*(pump(source, domain) for source in self.sources))
+
+        async def produce():
+            # Wake the consumer on success and on failure; a cancelled producer has no consumer left
+            try:
+                await asyncio.gather(*(worker() for _ in range(min(self.max_domains, len(domains)))))
+            except Exception:
+                await results.put(done)
+                raise
+            await results.put(done)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                result = await results.get()
+                if result is done:
+                    break
+                yield result
+            # Surface any exception raised by the producer
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
@@ -0,0 +1,193 @@
+# core/server.py
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from .filters import URLFilter
+from .harvester import URLHarvester
+from .metrics import MetricsRegistry
+from .pipeline import dedupe_stage, filter_stage
+from .scheduler import HarvestScheduler, SOURCES
+
+DEFAULT_PORT = 8787
+
+# Rows are sent in batches; a batch also goes out once this many seconds have passed
+FLUSH_ROWS = 500
+FLUSH_INTERVAL = 0.2
+
+# Job fields that are a list of strings, given either as a JSON list or a comma-separated string
+LIST_FIELDS = ('extensions', 'exclude_extensions', 'include', 'exclude')
+
+class JobError(ValueError):
+    """A submitted job is malformed"""
+
+def _string_list(job: Dict, field: str) -> Optional[List[str]]:
+    value = job.get(field)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise JobError(f"'{field}' must be a list of strings or a comma-separated string")
+    return [item.strip() for item in value if item.strip()] or None
+
+def parse_job(job) -> Dict:
+    """Validate a job body and return the scheduler and filter options it asks for"""
+    if not isinstance(job, dict):
+        raise JobError("Job must be a JSON object")
+    domains = _string_list(job, 'domains')
+    if not domains:
+        raise JobError("'domains' is required")
+    sources = _string_list(job, 'sources') or list(SOURCES)
+    unknown = set(sources) - set(SOURCES)
+    if unknown:
+        raise JobError(f"Unknown sources: {', '.join(sorted(unknown))}")
+    minlen = job.get('minlen', 10)
+    if not isinstance(minlen, int) or isinstance(minlen, bool):
+        raise JobError("'minlen' must be an integer")
+    options = {'domains': domains, 'sources': sources, 'include_subs': bool(job.get('include_subs', False)),
+               'minlen': minlen}
+    for field in LIST_FIELDS:
+        options[field] = _string_list(job, field)
+    for field in ('start_date', 'end_date'):
+        value = job.get(field)
+        if value is not None and not isinstance(value, str):
+            raise JobError(f"'{field}' must be a YYYY-MM-DD string")
+        options[field] = value
+    return options
+
+class HarvestServer:
+    """Keeps one URLHarvester session warm and runs harvest jobs submitted over HTTP.
+
+    POST /jobs takes a JSON job (domains plus filter options) and streams the
+    deduplicated rows back as JSON lines, ending with a summary line. Every job
+    shares the harvester's connection pool, response cache and per-host rate
+    limits; at most max_jobs run at once and the rest wait their turn.
+    """
+
+    def __init__(self, harvester: URLHarvester, max_jobs: int = 4, max_domains: int = 10,
+                 metrics: Optional[MetricsRegistry] = None, on_metrics=None):
+        self.harvester = harvester
+        self.max_domains = max_domains
+        self.metrics = metrics or MetricsRegistry()
+        # Called before /metrics is rendered so gauges such as cache hits are current
+        self.on_metrics = on_metrics
+        self.slots = asyncio.Semaphore(max(1, max_jobs))
+        self.running = 0
+        self.served = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/jobs', self.handle_job)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/metrics', self.handle_metrics)
+        return app
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        cache = self.harvester.cache
+        return web.json_response({
+            'status': 'ok',
+            'jobs_running': self.running,
+            'jobs_served': self.served,
+            'cache_hits': cache.hits if cache else None,
+            'cache_misses': cache.misses if cache else None,
+        })
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        if self.on_metrics:
+            self.on_metrics(self.metrics)
+        self.metrics.finish()
+        return web.Response(text=self.metrics.to_prometheus(), content_type='text/plain')
+
+    async def handle_job(self, request: web.Request) -> web.StreamResponse:
+        try:
+            options = parse_job(await request.json())
+            url_filter = URLFilter(
+                allowed_schemes=('http', 'https'),
+                min_length=options['minlen'],
+                extensions=options['extensions'],
+                exclude_extensions=options['exclude_extensions'],
+                include=options['include'],
+                exclude=options['exclude'],
+                start_date=options['start_date'],
+                end_date=options['end_date']
+            )
+        except ValueError as e:
+            # JobError, a body that is not JSON at all, or a malformed date
+            return web.json_response({'error': str(e)}, status=400)
+        scheduler = HarvestScheduler(self.harvester, max_domains=self.max_domains,
+                                     include_subs=options['include_subs'], sources=options['sources'],
+                                     start=url_filter.start_date, end=url_filter.end_date,
+                                     cdx_filters=url_filter.cdx_filters())
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        async with self.slots:
+            self.running += 1
+            try:
+                await self._run_job(scheduler, url_filter, options['domains'], response)
+            except ConnectionResetError:
+                # The client went away; stop harvesting for it
+                self.metrics.inc('jobs_total', outcome='disconnected')
+                return response
+            finally:
+                self.running -= 1
+                self.served += 1
+        await response.write_eof()
+        return response
+
+    async def _run_job(self, scheduler: HarvestScheduler, url_filter: URLFilter, domains: List[str],
+                       response: web.StreamResponse):
+        started = time.perf_counter()
+        results = filter_stage(scheduler.stream(domains), url_filter.clean)
+        results = dedupe_stage(results, seen=url_filter.new_deduplicator())
+        count = 0
+        chunk = []
+        flushed = time.monotonic()
+        summary = {'done': True}
+        try:
+            async for result in results:
+                chunk.append(json.dumps({'url': result.url, 'source': result.source,
+                                         'timestamp': result.timestamp, 'status_code': result.status_code}))
+                count += 1
+                if len(chunk) >= FLUSH_ROWS or time.monotonic() - flushed >= FLUSH_INTERVAL:
+                    await response.write(('\n'.join(chunk) + '\n').encode())
+                    chunk = []
+                    flushed = time.monotonic()
+        except ConnectionResetError:
+            raise
+        except Exception as e:
+            print(f"[Server] Job for {', '.join(domains)} failed: {e}")
+            summary = {'done': False, 'error': str(e)}
+        finally:
+            await results.aclose()
+
+        seconds = time.perf_counter() - started
+        summary.update(urls=count, seconds=round(seconds, 3))
+        chunk.append(json.dumps(summary))
+        await response.write(('\n'.join(chunk) + '\n').encode())
+        self.metrics.inc('jobs_total', outcome='ok' if summary['done'] else 'error')
+        self.metrics.record_stage('job', count, seconds)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, socket_path: Optional[str] = None):
+        """Listen on a TCP port, or on a Unix socket when socket_path is given, until cancelled"""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        if socket_path:
+            site = web.UnixSite(runner, socket_path)
+            where = socket_path
+        else:
+            site = web.TCPSite(runner, host, port)
+            where = f"http://{host}:{port}"
+        await site.start()
+        print(f"[Server] Listening on {where}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
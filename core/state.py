@@ -0,0 +1,41 @@
+# core/state.py
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+class HarvestState:
+    """Newest snapshot timestamp seen per domain and source, persisted between runs"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        self._previous_domains = set(self.data)
+
+    def since(self, domain: str, source: str) -> Optional[str]:
+        """Timestamp (YYYYMMDDhhmmss) of the newest row seen last time, if any"""
+        return self.data.get(domain, {}).get(source)
+
+    def seen_before(self, domain: str) -> bool:
+        """Whether the domain was harvested by an earlier run (not just by this one)"""
+        return domain in self._previous_domains
+
+    def update(self, domain: str, source: str, timestamps: Iterable[str]):
+        newest = self.since(domain, source) or ''
+        for timestamp in timestamps:
+            if timestamp and timestamp > newest:
+                newest = timestamp
+        self.data.setdefault(domain, {})
+        if newest:
+            self.data[domain][source] = newest
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,284 @@
+# core/store.py
+import mmap
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .records import URLBatch, URLResult, source_id, source_name
+from .urls import URL_PARTS, strip_params
+
+MAGIC = b'PYBURLS2'
+# Version 1 stores had 16-bit extension ids and are still readable
+_MAGIC_V1 = b'PYBURLS1'
+
+# Sections in file order: (name, array typecode or None for raw bytes)
+_SECTIONS = (
+    ('url_offsets', 'Q'),    # byte offset of each URL in url_blob, plus the end offset
+    ('path_starts', 'I'),    # byte offset of the path inside each URL
+    ('host_ids', 'I'),
+    ('ext_ids', 'I'),
+    ('timestamps', 'q'),
+    ('sources', 'B'),
+    ('status_codes', 'H'),
+    ('host_starts', 'Q'),    # first row of each host, plus the row count
+    ('url_blob', None),
+    ('hosts', None),         # newline separated, sorted
+    ('extensions', None),    # newline separated, id 0 is "no extension"
+    ('source_names', None),  # newline separated, indexed by the sources column
+)
+
+_HEADER = struct.Struct('<8sQ')
+_SECTION = struct.Struct('<QQ')
+
+def _split_url(url: str) -> Tuple[str, int, str]:
+    """(host, byte offset of the path, extension) for one URL"""
+    match = URL_PARTS.match(url)
+    netloc = (match.group(2) or '').rpartition('@')[2].lower()
+    host = netloc[:netloc.index(']') + 1] if netloc.startswith('[') and ']' in netloc else netloc.partition(':')[0]
+    path_start = match.start(3)
+    name = strip_params(match.group(3).rsplit('/', 1)[-1])
+    ext = ''
+    if '.' in name:
+        ext = name.rsplit('.', 1)[1].lower()
+        if len(ext) > 5:
+            ext = ''
+    return host, len(url[:path_start].encode('utf-8')), ext
+
+def write_store(url_results, filename: str) -> int:
+    """Write results as a sorted, indexed store file; returns the number of rows"""
+    if isinstance(url_results, URLBatch):
+        urls = url_results.urls
+        row_sources = url_results.sources
+        row_timestamps = url_results.timestamps
+        row_status = url_results.status_codes
+    else:
+        batch = URLBatch(url_results)
+        urls, row_sources, row_timestamps, row_status = batch.urls, batch.sources, batch.timestamps, batch.status_codes
+
+    parts = [_split_url(url) for url in urls]
+    encoded = [url.encode('utf-8') for url in urls]
+    # Rows sorted by host, then path, so one host is a contiguous range and path prefixes are bisectable
+    order = sorted(range(len(urls)), key=lambda i: (parts[i][0], encoded[i][parts[i][1]:], encoded[i]))
+
+    hosts = sorted({host for host, _, _ in parts})
+    host_index = {host: index for index, host in enumerate(hosts)}
+    ext_names = [''] + sorted({ext for _, _, ext in parts if ext})
+    ext_index = {ext: index for index, ext in enumerate(ext_names)}
+    used_sources = sorted(set(row_sources))
+    names = [source_name(source) if source in used_sources else '' for source in range(max(used_sources, default=-1) + 1)]
+
+    columns: Dict[str, array] = {name: array(code) for name, code in _SECTIONS if code}
+    blob = bytearray()
+    host_starts = columns['host_starts']
+    previous_host = None
+    for row, i in enumerate(order):
+        host, path_start, ext = parts[i]
+        columns['url_offsets'].append(len(blob))
+        blob += encoded[i]
+        columns['path_starts'].append(path_start)
+        columns['host_ids'].append(host_index[host])
+        columns['ext_ids'].append(ext_index[ext])
+        columns['timestamps'].append(row_timestamps[i])
+        columns['sources'].append(row_sources[i])
+        columns['status_codes'].append(row_status[i])
+        if host != previous_host:
+            host_starts.append(row)
+            previous_host = host
+    columns['url_offsets'].append(len(blob))
+    host_starts.append(len(order))
+
+    payloads = []
+    for name, code in _SECTIONS:
+        if code:
+            payloads.append(columns[name].tobytes())
+        elif name == 'url_blob':
+            payloads.append(bytes(blob))
+        else:
+            values = {'hosts': hosts, 'extensions': ext_names, 'source_names': names}[name]
+            payloads.append('\n'.join(values).encode('utf-8'))
+
+    with open(filename, 'wb') as f:
+        position = _HEADER.size + _SECTION.size * len(_SECTIONS)
+        table = []
+        for payload in payloads:
+            # Keep every section 8-byte aligned so the columns can be viewed in place
+            position += -position % 8
+            table.append((position, len(payload)))
+            position += len(payload)
+        f.write(_HEADER.pack(MAGIC, len(order)))
+        for offset, length in table:
+            f.write(_SECTION.pack(offset, length))
+        for (offset, _), payload in zip(table, payloads):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(payload)
+    return len(order)
+
+class URLStore:
+    """Read-only, memory-mapped view of a store file; rows are decoded only when a query reaches them"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic not in (MAGIC, _MAGIC_V1):
+            self.close()
+            raise ValueError(f"{filename} is not a pybackurls store")
+        self._view = view = memoryview(self._map)
+        sections = {}
+        for index, (name, code) in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(self._map, _HEADER.size + index * _SECTION.size)
+            section = view[offset:offset + length]
+            if name == 'ext_ids' and magic == _MAGIC_V1:
+                code = 'H'
+            sections[name] = section.cast(code) if code else section
+        self._sections = sections
+        self.url_blob = sections['url_blob']
+        self.url_offsets = sections['url_offsets']
+        self.path_starts = sections['path_starts']
+        self.host_ids = sections['host_ids']
+        self.ext_ids = sections['ext_ids']
+        self.timestamps = sections['timestamps']
+        self.sources = sections['sources']
+        self.status_codes = sections['status_codes']
+        self.host_starts = sections['host_starts']
+        self.hosts: List[str] = self._strings('hosts')
+        self.extensions: List[str] = self._strings('extensions')
+        self.source_names: List[str] = self._strings('source_names')
+
+    def _strings(self, name: str) -> List[str]:
+        data = bytes(self._sections[name]).decode('utf-8')
+        return data.split('\n') if data else []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def url(self, row: int) -> str:
+        return bytes(self.url_blob[self.url_offsets[row]:self.url_offsets[row + 1]]).decode('utf-8')
+
+    def _path(self, row: int) -> bytes:
+        return bytes(self.url_blob[self.url_offsets[row] + self.path_starts[row]:self.url_offsets[row + 1]])
+
+    def result(self, row: int) -> URLResult:
+        result = URLResult(self.url(row), self.source_names[self.sources[row]])
+        result.timestamp_value = self.timestamps[row]
+        result.status_code = self.status_codes[row] or None
+        return result
+
+    def host_ranges(self, host: Optional[str] = None, include_subs: bool = False) -> Iterator[Tuple[int, int]]:
+        """(start, end) row range of each matching host, or of every host when none is given"""
+        starts = self.host_starts
+        if host is not None:
+            host = host.lower()
+            suffix = '.' + host
+        for index, name in enumerate(self.hosts):
+            if host is None or name == host or (include_subs and name.endswith(suffix)):
+                yield starts[index], starts[index + 1]
+
+    def _prefix_range(self, start: int, end: int, prefix: bytes) -> Tuple[int, int]:
+        """Rows of one host range whose path starts with prefix, found by binary search"""
+        path = self._path
+        lo, hi = start, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if path(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        first = lo
+        hi = end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if path(mid)[:len(prefix)] <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def query(self, host: Optional[str] = None, include_subs: bool = False,
+              extensions: Optional[Iterable[str]] = None, prefix: Optional[str] = None,
+              after: Optional[int] = None, before: Optional[int] = None) -> Iterator[int]:
+        """Row numbers matching every given condition.
+
+        after is inclusive and before exclusive, both as 14-digit timestamps;
+        rows without a timestamp never match a date condition.
+        """
+        ext_ids = None
+        if extensions is not None:
+            wanted = {ext.lower().strip().strip('.') for ext in extensions}
+            ext_ids = {index for index, ext in enumerate(self.extensions) if ext and ext in wanted}
+            if not ext_ids:
+                return
+        encoded_prefix = prefix.encode('utf-8') if prefix else None
+        for start, end in self.host_ranges(host, include_subs):
+            # Paths are sorted within each host, so a prefix narrows the range by binary search
+            if encoded_prefix is not None:
+                start, end = self._prefix_range(start, end, encoded_prefix)
+            yield from self._filter_rows(start, end, ext_ids, after, before)
+
+    def _filter_rows(self, start: int, end: int, ext_ids, after: Optional[int], before: Optional[int]) -> Iterator[int]:
+        row_exts = self.ext_ids
+        timestamps = self.timestamps
+        dated = after is not None or before is not None
+        for row in range(start, end):
+            if ext_ids is not None and row_exts[row] not in ext_ids:
+                continue
+            if dated:
+                timestamp = timestamps[row]
+                if not timestamp or (after is not None and timestamp < after) or \
+                        (before is not None and timestamp >= before):
+                    continue
+            yield row
+
+    def close(self):
+        # Views must be released before the map can close
+        for section in getattr(self, '_sections', {}).values():
+            section.release()
+        self._sections = {}
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class StoreStreamWriter:
+    """Collects rows and writes the store when closed, since rows must be sorted first.
+
+    The store is always one uncompressed file so that it can be memory-mapped;
+    compress and shard_size are accepted for interface parity and ignored.
+    """
+
+    def __init__(self, filename: str, compress: Optional[str] = None, shard_size: Optional[int] = None):
+        self.filename = filename
+        self.paths = [filename]
+        self.count = 0
+        self.statistics = None
+        self._batch = URLBatch()
+
+    def write(self, result: URLResult):
+        self._batch.append(result)
+        self.count += 1
+
+    def write_row(self, url: str, source: str, timestamp: str, status_code: Optional[int]):
+        self._batch.append_row(url, source_id(source), int(timestamp or 0), status_code)
+        self.count += 1
+
+    def set_statistics(self, stats: Dict):
+        self.statistics = stats
+
+    def close(self):
+        if self._batch is not None:
+            write_store(self._batch, self.filename)
+            self._batch = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,93 @@
+# core/transport.py
+import json
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+from .metrics import MetricsRegistry
+
+JSON_DECODERS = ('auto', 'orjson', 'json')
+
+def load_json_decoder(name: str = 'auto') -> Callable:
+    """loads() for bytes or str: orjson when asked for or, with 'auto', when installed; the stdlib otherwise"""
+    if name not in JSON_DECODERS:
+        raise ValueError(f"Unknown JSON decoder: {name}")
+    if name != 'json':
+        try:
+            import orjson
+            return orjson.loads
+        except ImportError:
+            if name == 'orjson':
+                raise RuntimeError("The orjson decoder requires the 'orjson' package (pip install orjson)")
+    return json.loads
+
+def brotli_available() -> bool:
+    """aiohttp decodes br bodies only when a Brotli binding is installed"""
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            pass
+    return False
+
+class TransportProfile:
+    """Connection pool, timeout, DNS and compression settings for the harvester's HTTP session.
+
+    There is no total timeout by default: a multi-GB CDX stream that keeps
+    delivering data may take as long as it needs, while a connection that
+    stalls for read_timeout seconds is abandoned and retried.
+    """
+
+    def __init__(self, limit: int = 50, limit_per_host: int = 0, connect_timeout: float = 10.0,
+                 read_timeout: float = 60.0, total_timeout: Optional[float] = None, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, compress: bool = True, json_decoder: str = 'auto'):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.compress = compress
+        self.json_decoder = json_decoder
+
+    def connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=self.dns_cache_ttl > 0,
+            ttl_dns_cache=self.dns_cache_ttl or None,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.total_timeout, sock_connect=self.connect_timeout,
+                                     sock_read=self.read_timeout)
+
+    def headers(self) -> Dict[str, str]:
+        if not self.compress:
+            return {'Accept-Encoding': 'identity'}
+        return {'Accept-Encoding': 'gzip, deflate, br' if brotli_available() else 'gzip, deflate'}
+
+    def session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(connector=self.connector(), timeout=self.timeout(), headers=self.headers())
+
+def transport_report(metrics: MetricsRegistry) -> List[str]:
+    """One line per source: requests, decompressed body size and the time spent decoding rows"""
+    requests: Dict[str, float] = {}
+    for labels, count in metrics.counters.get('requests_total', {}).items():
+        source = dict(labels)['source']
+        requests[source] = requests.get(source, 0) + count
+    body = {dict(labels)['source']: value for labels, value in metrics.counters.get('body_bytes_total', {}).items()}
+    decode = {dict(labels)['source']: value for labels, value in metrics.counters.get('decode_seconds_total', {}).items()}
+    rows = {dict(labels)['source']: value for labels, value in metrics.counters.get('decoded_rows_total', {}).items()}
+
+    lines = []
+    for source in sorted(set(requests) | set(body) | set(decode)):
+        seconds = decode.get(source, 0.0)
+        decoded = int(rows.get(source, 0))
+        rate = f", {decoded / seconds:,.0f} rows/s" if seconds and decoded else ""
+        lines.append(f"{source}: {int(requests.get(source, 0))} requests, "
+                     f"{body.get(source, 0) / 1048576:.1f} MB body, {decoded} rows decoded in {seconds:.2f}s{rate}")
+    return lines
@@ -0,0 +1,17 @@
+# core/urls.py
+import re
+from typing import Optional, Tuple
+
+# scheme, netloc, path and query of a URL in a single match, equivalent to urlsplit for our checks
+URL_PARTS = re.compile(r'^(?:([A-Za-z][A-Za-z0-9+.\-]*):)?(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?')
+
+def split_url(url: str) -> Tuple[Optional[str], Optional[str], str, Optional[str]]:
+    """(scheme, netloc, path, query) of a URL; scheme, netloc and query are None when absent"""
+    return URL_PARTS.match(url).groups()
+
+def strip_params(path: str) -> str:
+    """path without ;params on its last segment, as urlparse splits them off"""
+    if ';' not in path:
+        return path
+    head, slash, last = path.rpartition('/')
+    return head + slash + last.partition(';')[0]
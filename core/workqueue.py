@@ -0,0 +1,252 @@
+# core/workqueue.py
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .dedupe import Deduplicator
+from .filters import URLFilter
+from .harvester import URLHarvester
+from .records import URLResult
+
+DEFAULT_LEASE = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+
+SHARD_SUFFIX = '.rows.jsonl'
+
+class WorkQueue:
+    """Harvest work units in a SQLite file shared by a coordinator and any number of workers.
+
+    A worker leases a unit for a limited time and renews the lease while it
+    works. A unit whose lease runs out, because its worker died or lost the
+    shared storage, goes to the next worker that asks. Each lease carries a
+    token, so a worker that lost its lease cannot complete or fail the unit
+    after someone else picked it up.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        # Autocommit; every state change below is a single statement or an explicit transaction
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        # Rollback journal rather than WAL: WAL needs shared memory, which network filesystems lack
+        self.db.execute('PRAGMA journal_mode=DELETE')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY,
+                domain TEXT NOT NULL,
+                source TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                token TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER,
+                UNIQUE (domain, source, unit)
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def set_meta(self, **meta):
+        """Job-wide settings, such as the filters every worker applies"""
+        self.db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                            [(key, json.dumps(value)) for key, value in meta.items()])
+
+    def meta(self) -> Dict:
+        return {key: json.loads(value) for key, value in self.db.execute('SELECT key, value FROM meta')}
+
+    def add(self, units: Iterable[Dict]) -> int:
+        """Queue units from URLHarvester.plan_units(); units already queued are left alone. Returns how many were new"""
+        before = self.db.total_changes
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO units (domain, source, unit, payload) VALUES (?, ?, ?, ?)',
+                [(unit['domain'], unit['source'], unit['unit'], json.dumps(unit)) for unit in units]
+            )
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        return self.db.total_changes - before
+
+    def lease(self, worker: str, seconds: float = DEFAULT_LEASE) -> Optional[Dict]:
+        """Take the next pending or expired unit; returns its payload plus 'id' and 'token', None when nothing is free"""
+        now = time.time()
+        token = os.urandom(8).hex()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute(
+                "SELECT id, payload FROM units WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1", (now,)
+            ).fetchone()
+            if row:
+                self.db.execute(
+                    "UPDATE units SET status = 'leased', worker = ?, token = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?", (worker, token, now + seconds, row[0])
+                )
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        if not row:
+            return None
+        unit = json.loads(row[1])
+        unit.update(id=row[0], token=token)
+        return unit
+
+    def _update_leased(self, sql: str, params: tuple, unit: Dict) -> bool:
+        cursor = self.db.execute(f"{sql} WHERE id = ? AND token = ? AND status = 'leased'",
+                                 params + (unit['id'], unit['token']))
+        return cursor.rowcount == 1
+
+    def renew(self, unit: Dict, seconds: float = DEFAULT_LEASE) -> bool:
+        """Extend a lease; False if it was lost to another worker"""
+        return self._update_leased('UPDATE units SET lease_expires = ?', (time.time() + seconds,), unit)
+
+    def complete(self, unit: Dict, rows: int) -> bool:
+        return self._update_leased("UPDATE units SET status = 'done', rows = ?, lease_expires = NULL", (rows,), unit)
+
+    def fail(self, unit: Dict, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        """Give a unit back for another try, or mark it failed once it has used max_attempts leases"""
+        return self._update_leased(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_expires = NULL", (max_attempts,), unit
+        )
+
+    def retry_failed(self) -> int:
+        """Put failed units back on the queue with a fresh attempt count"""
+        return self.db.execute("UPDATE units SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Units per state; leases that ran out count as pending"""
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        rows = self.db.execute(
+            "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END, COUNT(*) "
+            "FROM units GROUP BY 1", (time.time(),)
+        )
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+    def finished(self) -> bool:
+        counts = self.counts()
+        return not counts['pending'] and not counts['leased']
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class QueueWorker:
+    """Leases units from a WorkQueue, fetches and filters them, and appends the rows to this worker's shard"""
+
+    def __init__(self, queue: WorkQueue, harvester: URLHarvester, url_filter: URLFilter, shard_path: str,
+                 worker_id: str, concurrency: int = 4, lease_seconds: float = DEFAULT_LEASE,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, poll_interval: float = 5.0):
+        self.queue = queue
+        self.harvester = harvester
+        self.url_filter = url_filter
+        self.shard_path = shard_path
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.units = 0
+        self.rows = 0
+        self.failed = 0
+        self._seen: Optional[Deduplicator] = None
+        self._shard = None
+
+    async def _keep_lease(self, unit: Dict):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self.queue.renew(unit, self.lease_seconds):
+                print(f"[Worker] Lost the lease on {unit['domain']} {unit['source']} {unit['unit']}")
+                return
+
+    async def _process(self, unit: Dict):
+        keeper = asyncio.ensure_future(self._keep_lease(unit))
+        try:
+            results = await self.harvester.fetch_unit(unit)
+        except Exception as e:
+            print(f"[Worker] {unit['domain']} {unit['source']} {unit['unit']} failed: {e}")
+            results = None
+        finally:
+            keeper.cancel()
+        if results is None:
+            self.failed += 1
+            self.queue.fail(unit, self.max_attempts)
+            return
+
+        rows = 0
+        shard = self._shard
+        for result in results:
+            result = self.url_filter.clean(result)
+            # Dedupe within this worker's shard only; the merge step dedupes across workers
+            if result is None or not self._seen.add(result.url):
+                continue
+            shard.write(json.dumps([result.url, result.source, result.timestamp_value, result.status_code]) + '\n')
+            rows += 1
+        # Rows must be on disk before the unit is marked done; a crash in between only repeats the unit
+        shard.flush()
+        os.fsync(shard.fileno())
+        if not self.queue.complete(unit, rows):
+            print(f"[Worker] Lease on {unit['domain']} {unit['source']} {unit['unit']} expired before it finished")
+        self.units += 1
+        self.rows += rows
+
+    async def _lane(self):
+        while True:
+            unit = self.queue.lease(self.worker_id, self.lease_seconds)
+            if unit is None:
+                if self.queue.finished():
+                    return
+                # Other workers still hold leases; one may expire and come back to us
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._process(unit)
+
+    async def run(self):
+        """Work until every unit in the queue is done or failed"""
+        self._seen = self.url_filter.new_deduplicator()
+        self._shard = open(self.shard_path, 'a', encoding='utf-8')
+        try:
+            await asyncio.gather(*(self._lane() for _ in range(self.concurrency)))
+        finally:
+            self._shard.close()
+            self._seen.close()
+
+def shard_paths(directory: str) -> List[str]:
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SHARD_SUFFIX))
+
+def read_shard(path: str) -> Iterator[URLResult]:
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                url, source, timestamp, status_code = json.loads(line)
+            except ValueError:
+                continue  # torn final line from a worker that crashed mid-write
+            yield URLResult(url, source, timestamp, status_code)
+
+def merge_shards(paths: Iterable[str], writer, seen: Deduplicator) -> int:
+    """Write every row of the worker shards to writer once per URL; returns the number written"""
+    count = 0
+    try:
+        for path in paths:
+            for result in read_shard(path):
+                if seen.add(result.url):
+                    writer.write(result)
+                    count += 1
+    finally:
+        seen.close()
+    return count
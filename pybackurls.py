@@ -2,18 +2,33 @@
 
 import argparse
 import asyncio
+import contextlib
 from datetime import datetime
 import sys
+import time
 from pathlib import Path
-from urllib.parse import unquote, urlparse
 
-from core.harvester import URLHarvester
-from core.analyzer import URLAnalyzer
-from core.exporters import URLExporter
-from core.filters import URLFilter
-from core.utils import DisplayManager
+from core.cache import DEFAULT_CACHE_DIR, DEFAULT_TTLS, ResponseCache
+from core.clustering import URLClusterer
+from core.harvester import URLHarvester, check_cc_indexes
+from core.journal import HarvestJournal
+from core.metrics import PROFILE_MODES, MetricsRegistry, RunProfiler
+from core.records import URLBatch
+from core.ratelimit import RateLimiter
+from core.state import HarvestState
+from core.scheduler import HarvestScheduler, SOURCES
+from core.exporters import COMPRESSIONS, URLExporter, zstd_available
+from core.filters import URLFilter, date_to_int
+from core.store import URLStore
+from core.transport import JSON_DECODERS, TransportProfile, load_json_decoder, transport_report
+from core.pipeline import dedupe_stage, filter_stage, tap_stage
 import os
 
+# Rich and the analyzer are imported on first use so --pipe and query start quickly
+
+# Seconds between stdout flushes in --pipe mode, so URLs reach the next command promptly
+PIPE_FLUSH_INTERVAL = 0.2
+
 def clean_and_filter_urls(
     url_results,
     allowed_schemes=('http', 'https'),
@@ -22,152 +37,769 @@ def clean_and_filter_urls(
     filter_patterns=None,
     exclude_patterns=None
 ):
-    unique = set()
-    filtered = []
-    for result in url_results:
-        url = unquote(result.url).strip()
-        parsed = urlparse(url)
-        if not url or parsed.scheme not in allowed_schemes or len(url) < min_length:
-            continue
-        if filter_ext and not any(parsed.path.lower().endswith(f".{ext}") for ext in filter_ext):
-            continue
-        if filter_patterns and not any(pat in url for pat in filter_patterns):
-            continue
-        if exclude_patterns and any(pat in url for pat in exclude_patterns):
-            continue
-        if url not in unique:
-            unique.add(url)
-            # Update the result's URL field to make sure it's decoded/cleaned everywhere else
-            result.url = url
-            filtered.append(result)
-    return filtered
+    url_filter = URLFilter(
+        allowed_schemes=allowed_schemes,
+        min_length=min_length,
+        extensions=filter_ext,
+        include=filter_patterns,
+        exclude=exclude_patterns
+    )
+    return url_filter.filter_urls(url_results)
 
-async def main():
-    # Argument parsing
-    parser = argparse.ArgumentParser(description="Pybackurls - Python Wayback and Recon URL Extractor")
-    parser.add_argument('domains', nargs='*', help='Target domains')
-    parser.add_argument('--include-subs', action='store_true', help='Include subdomains')
-    parser.add_argument('--format', choices=['txt', 'json', 'csv', 'html'], default='txt')
-    parser.add_argument('--output', '-o', help='Output filename')
+def _parse_source_pairs(value, allowed, minimum=0):
+    """Parse 'wayback=8,commoncrawl=4' into a {source: int} dict"""
+    pairs = {}
+    if not value:
+        return pairs
+    for item in value.split(','):
+        source, _, number = item.partition('=')
+        source = source.strip()
+        if source not in allowed or not number.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid source setting: {item}")
+        if int(number) < minimum:
+            raise argparse.ArgumentTypeError(f"Invalid source setting: {item} (must be at least {minimum})")
+        pairs[source] = int(number)
+    return pairs
+
+def parse_source_limits(value):
+    # A limit of 0 would leave that source waiting forever
+    return _parse_source_pairs(value, SOURCES, minimum=1)
+
+def parse_cache_ttls(value):
+    """Parse per-source cache TTLs given in hours into seconds"""
+    hours = _parse_source_pairs(value, DEFAULT_TTLS)
+    return {source: ttl * 3600 for source, ttl in hours.items()}
+
+def parse_cc_indexes(value):
+    try:
+        return check_cc_indexes(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_date(value):
+    """A YYYY-MM-DD date, checked here so a typo is a usage error rather than a traceback"""
+    try:
+        date_to_int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+    return value
+
+def parse_json_decoder(value):
+    if value == 'orjson':
+        try:
+            load_json_decoder(value)
+        except RuntimeError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return value
+
+def resolve_output_filename(args):
+    output_dir = "results"
+    Path(output_dir).mkdir(exist_ok=True)
+    if args.output:
+        # If user provided a filename, save inside the output directory if it's just a filename (no path)
+        if os.path.dirname(args.output):
+            # User provided full or relative path, respect it as-is
+            return args.output
+        return os.path.join(output_dir, args.output)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(output_dir, f"pybackurls_results_{timestamp}.{args.format}")
+
+def print_recon_highlights(recon_highlights):
+    if recon_highlights:
+        print("\nRecon Highlights")
+        print("-" * 60)
+        for item in recon_highlights:
+            print(f"{item['type']}: {item['url']}")
+        print("-" * 60)
+    else:
+        print("\nNo recon highlights detected in this run.")
+
+async def replay_then(replayed, results):
+    """Rows restored from a job journal, followed by the live results"""
+    for result in replayed:
+        yield result
+    async for result in results:
+        yield result
+
+async def stream_results(results, url_filter, writer, analyzer, stats=None, metrics=None, clusterer=None):
+    """Clean, dedupe, optionally cluster and export results as they arrive; returns the recon highlights seen on the way"""
+    recon_highlights = []
+    counts = {'harvest': 0}
+    started = time.perf_counter()
+    if metrics is not None:
+        results = tap_stage(results, lambda result: counts.__setitem__('harvest', counts['harvest'] + 1))
+    results = filter_stage(results, url_filter.clean)
+    results = dedupe_stage(results, seen=url_filter.new_deduplicator())
+    if clusterer is not None:
+        results = cluster_stage(results, clusterer)
+    results = tap_stage(results, lambda result: recon_highlights.extend(analyzer.find_recon_highlights([result])))
+    if stats is not None:
+        results = tap_stage(results, lambda result: stats.add(result.url, result.source, result.timestamp_value))
+    async for result in results:
+        writer.write(result)
+    if metrics is not None:
+        # Stages run interleaved, so each one's rate is measured over the whole stream
+        elapsed = time.perf_counter() - started
+        metrics.record_stage('harvest', counts['harvest'], elapsed)
+        metrics.record_stage('export', writer.count, elapsed)
+    return recon_highlights
+
+def show_stats(args, display, stats):
+    if args.show_stats:
+        display.show_stats_table(stats)
+    if args.analyze and stats.get('parameters_found'):
+        print("\nCommon GET parameters (Top 10):")
+        for k, v in stats['parameters_found'].items():
+            print(f"  {k}: {v}")
+
+def build_url_filter(args):
+    """Every filtering option compiled into one predicate applied in a single pass"""
+    return URLFilter(
+        allowed_schemes=('http', 'https'),
+        min_length=args.minlen,
+        extensions=args.extensions.split(',') if args.extensions else None,
+        exclude_extensions=args.exclude_extensions.split(',') if args.exclude_extensions else None,
+        include=args.include.split(',') if args.include else None,
+        exclude=args.exclude.split(',') if args.exclude else None,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        dedupe_memory=args.dedupe_memory * 1024 * 1024,
+        dedupe_approximate=args.dedupe_approximate
+    )
+
+def build_clusterer(args, analyzer=None):
+    """URLClusterer for --cluster; path segments matching a highlight rule are never collapsed"""
+    if not args.cluster:
+        return None
+    if analyzer is None:
+        from core.analyzer import URLAnalyzer
+        analyzer = URLAnalyzer(rules_files=args.rules)
+    return URLClusterer(keep=args.cluster_keep, max_children=args.cluster_fanout, protect=analyzer.is_highlight)
+
+def cluster_stage(results, clusterer):
+    """Only the representatives of each URL template"""
+    return filter_stage(results, lambda result: result if clusterer.add(result.url) else None)
+
+def report_clusters(clusterer, report_path):
+    """Print how far clustering shrank the results and write the per-template report if asked for"""
+    templates = clusterer.write_report(report_path) if report_path else sum(1 for _ in clusterer.clusters())
+    print(f"[*] Clustered {clusterer.urls} URLs into {templates} templates, kept {clusterer.kept}")
+    if report_path:
+        print(f"[*] Cluster report saved to {report_path}")
+
+def build_cache(args):
+    if args.no_cache:
+        return None
+    return ResponseCache(args.cache_dir, ttls=args.cache_ttl,
+                         max_bytes=args.cache_size * 1024 * 1024, refresh=args.refresh_cache)
+
+def build_transport(args):
+    return TransportProfile(limit=args.threads, limit_per_host=args.limit_per_host,
+                            connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                            dns_cache_ttl=args.dns_ttl, keepalive_timeout=args.keepalive,
+                            compress=not args.no_compression, json_decoder=args.json_decoder)
+
+def build_harvester(args, **components):
+    """URLHarvester configured from the command line; components are cache, rate_limiter, journal and metrics"""
+    return URLHarvester(max_concurrent=args.threads, source_limits=args.source_limits,
+                        page_concurrency=args.page_concurrency, page_retries=args.page_retries,
+                        cc_indexes=args.cc_indexes, cc_max_pages=args.cc_max_pages,
+                        pushdown=not args.no_pushdown, transport=build_transport(args), **components)
+
+def record_run_metrics(metrics, cache, rate_limiter):
+    if cache:
+        metrics.set('cache_hits', cache.hits)
+        metrics.set('cache_misses', cache.misses)
+        lookups = cache.hits + cache.misses
+        metrics.set('cache_hit_ratio', round(cache.hits / lookups, 4) if lookups else 0)
+    for host, limiter in rate_limiter.hosts.items():
+        metrics.set('host_concurrency_window', round(limiter.limit, 2), host=host)
+        metrics.set('host_backoffs', limiter.backoffs, host=host)
+
+def add_harvest_arguments(parser):
+    """Options that configure the harvester itself, shared by harvest runs, serve and the distributed commands"""
     parser.add_argument('--threads', type=int, default=50, help='Concurrent threads')
+    parser.add_argument('--domain-concurrency', type=int, default=10, help='Domains harvested in parallel (default 10)')
+    parser.add_argument('--source-limits', type=parse_source_limits, default={},
+                        help='Per-source request limits, e.g. wayback=8,commoncrawl=4,virustotal=2')
+    parser.add_argument('--page-concurrency', type=int, default=4, help='Wayback CDX pages fetched in parallel per domain (default 4)')
+    parser.add_argument('--page-retries', type=int, default=3, help='Retries for a failed CDX page (default 3)')
+    parser.add_argument('--host-rate', type=float, default=10.0,
+                        help='Maximum requests per second to each archive host (default 10)')
+    parser.add_argument('--host-concurrency', type=int, default=32,
+                        help='Upper bound for the adaptive per-host concurrency window (default 32)')
+    parser.add_argument('--cc-indexes', type=parse_cc_indexes, default='latest:4',
+                        help="Common Crawl indexes to query: all, latest:N, YYYY-YYYY or comma-separated ids (default latest:4)")
+    parser.add_argument('--cc-max-pages', type=int, help='Maximum index pages fetched per Common Crawl index and domain')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the on-disk response cache')
+    parser.add_argument('--refresh-cache', action='store_true', help='Ignore cached responses and store fresh ones')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Response cache directory (default {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-ttl', type=parse_cache_ttls, default={},
+                        help='Per-source cache TTL in hours, e.g. wayback=12,commoncrawl=720')
+    parser.add_argument('--cache-size', type=int, default=2048, help='Maximum cache size in MB (default 2048)')
+    parser.add_argument('--no-pushdown', action='store_true',
+                        help='Fetch every CDX field and row and apply the filters only locally')
+    parser.add_argument('--limit-per-host', type=int, default=0,
+                        help='Open connections per archive host, 0 for no cap beyond --threads (default 0)')
+    parser.add_argument('--connect-timeout', type=float, default=10.0, help='Seconds to establish a connection (default 10)')
+    parser.add_argument('--read-timeout', type=float, default=60.0,
+                        help='Seconds a response may stall before it is retried; long streams that keep '
+                             'delivering are never cut off (default 60)')
+    parser.add_argument('--dns-ttl', type=int, default=300, help='Seconds DNS answers are cached, 0 to disable (default 300)')
+    parser.add_argument('--keepalive', type=float, default=30.0, help='Seconds idle connections are kept open (default 30)')
+    parser.add_argument('--no-compression', action='store_true', help='Ask archives for uncompressed responses')
+    parser.add_argument('--json-decoder', type=parse_json_decoder, choices=JSON_DECODERS, default='auto',
+                        help='JSON decoder: orjson, json (stdlib) or auto, orjson when installed (default auto)')
+
+def add_filter_arguments(parser):
+    """URL filtering options, shared by harvest runs and distributed jobs"""
     parser.add_argument('--extensions', help='Only include URLs with these extensions (comma-separated)')
     parser.add_argument('--exclude-extensions', help='Exclude URLs with these extensions (comma-separated)')
     parser.add_argument('--minlen', type=int, default=10, help='Minimum URL length (default 10)')
     parser.add_argument('--include', help='Only include URLs containing these strings (comma-separated)')
     parser.add_argument('--exclude', help='Exclude URLs containing these strings (comma-separated)')
-    parser.add_argument('--start-date', help='Start date (YYYY-MM-DD)')
-    parser.add_argument('--end-date', help='End date (YYYY-MM-DD)')
+    parser.add_argument('--start-date', type=parse_date, help='Start date (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=parse_date, help='End date (YYYY-MM-DD)')
+
+def add_dedupe_arguments(parser):
+    """URL dedupe options, shared by harvest runs, workers and merges"""
+    parser.add_argument('--dedupe-memory', type=int, default=512,
+                        help='Memory budget in MB for URL dedupe before it spills to disk (default 512); '
+                             'URLs are compared by 64-bit hash, so a collision can very rarely drop one')
+    parser.add_argument('--dedupe-approximate', action='store_true',
+                        help='Dedupe with Bloom filters that grow within the memory budget; may drop a tiny fraction of unique URLs')
+
+async def run_pipe(args):
+    """Headless mode: deduplicated URLs go to stdout as soon as they pass the filters, status lines to stderr"""
+    domains = args.domains or [line.strip() for line in sys.stdin if line.strip()]
+    if not domains:
+        print("No domains provided.", file=sys.stderr)
+        return
+
+    out = sys.stdout
+    url_filter = build_url_filter(args)
+    cache = build_cache(args)
+    state = HarvestState(args.state_file) if args.since_last_run else None
+    rate_limiter = RateLimiter(rate=args.host_rate, max_concurrency=args.host_concurrency)
+    metrics = MetricsRegistry()
+    complete = False
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(PIPE_FLUSH_INTERVAL)
+            out.flush()
+
+    # Archive status messages are printed; keep them out of the URL stream
+    with contextlib.redirect_stdout(sys.stderr):
+        async with build_harvester(args, cache=cache, rate_limiter=rate_limiter, metrics=metrics) as harvester:
+            scheduler = HarvestScheduler(harvester, max_domains=args.domain_concurrency,
+                                         include_subs=args.include_subs, state=state,
+                                         start=url_filter.start_date, end=url_filter.end_date,
+                                         cdx_filters=url_filter.cdx_filters())
+            results = filter_stage(scheduler.stream(domains), url_filter.clean)
+            results = dedupe_stage(results, seen=url_filter.new_deduplicator())
+            clusterer = build_clusterer(args)
+            if clusterer:
+                results = cluster_stage(results, clusterer)
+            flusher = asyncio.ensure_future(flush_periodically())
+            try:
+                with metrics.stage('pipe') as stage:
+                    async for result in results:
+                        out.write(result.url + '\n')
+                        stage['rows'] += 1
+                    out.flush()
+                complete = True
+            except BrokenPipeError:
+                # The reader went away (e.g. head); stop harvesting and silence the final flush
+                os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+            finally:
+                flusher.cancel()
+                await results.aclose()
+
+        record_run_metrics(metrics, cache, rate_limiter)
+        if cache:
+            cache.close()
+        if clusterer:
+            report_clusters(clusterer, args.cluster_report)
+        if harvester.failed_pages:
+            print(f"[!] {harvester.failed_pages} index pages still failed after retries; results are incomplete")
+        if state and complete and not harvester.failed_pages:
+            state.save()
+        metrics.finish()
+        if args.metrics:
+            metrics.write_json(args.metrics)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
+def run_query(argv):
+    """query subcommand: answer host, extension, path-prefix and date questions from a store file"""
+    parser = argparse.ArgumentParser(prog='pybackurls.py query',
+                                     description="Query a store written with --format store")
+    parser.add_argument('store', help='Store file')
+    parser.add_argument('--host', help='Only URLs on this host')
+    parser.add_argument('--include-subs', action='store_true', help='Also match subdomains of --host')
+    parser.add_argument('--ext', help='Only these extensions (comma-separated)')
+    parser.add_argument('--prefix', help='Only paths starting with this prefix, e.g. /admin')
+    parser.add_argument('--after', type=parse_date, help='Archived on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--before', type=parse_date, help='Archived before this date (YYYY-MM-DD)')
+    parser.add_argument('--count', action='store_true', help='Print only the number of matches')
+    parser.add_argument('--metadata', action='store_true', help='Also print source and timestamp')
+    args = parser.parse_args(argv)
+
+    try:
+        store = URLStore(args.store)
+    except (OSError, ValueError) as e:
+        print(f"[Query] {e}")
+        return
+    with store:
+        rows = store.query(host=args.host, include_subs=args.include_subs,
+                           extensions=args.ext.split(',') if args.ext else None,
+                           prefix=args.prefix, after=date_to_int(args.after), before=date_to_int(args.before))
+        if args.count:
+            print(sum(1 for _ in rows))
+            return
+        for row in rows:
+            if args.metadata:
+                print(f"{store.url(row)} # {store.source_names[store.sources[row]]} {store.timestamps[row] or ''}")
+            else:
+                print(store.url(row))
+
+async def run_serve(argv):
+    """serve subcommand: keep one warm harvester and take harvest jobs over HTTP or a Unix socket"""
+    from core.server import DEFAULT_PORT, HarvestServer
+
+    parser = argparse.ArgumentParser(prog='pybackurls.py serve',
+                                     description="Run harvest jobs submitted over HTTP with a warm connection pool")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default {DEFAULT_PORT})')
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--max-jobs', type=int, default=4, help='Jobs run at once; later ones queue (default 4)')
+    add_harvest_arguments(parser)
+    args = parser.parse_args(argv)
+
+    cache = build_cache(args)
+    rate_limiter = RateLimiter(rate=args.host_rate, max_concurrency=args.host_concurrency)
+    metrics = MetricsRegistry()
+    try:
+        async with build_harvester(args, cache=cache, rate_limiter=rate_limiter, metrics=metrics) as harvester:
+            server = HarvestServer(harvester, max_jobs=args.max_jobs, max_domains=args.domain_concurrency,
+                                   metrics=metrics,
+                                   on_metrics=lambda registry: record_run_metrics(registry, cache, rate_limiter))
+            await server.serve(args.host, args.port, socket_path=args.socket)
+    finally:
+        if cache:
+            cache.close()
+
+FILTER_OPTIONS = ('extensions', 'exclude_extensions', 'minlen', 'include', 'exclude', 'start_date', 'end_date')
+
+def filter_from_options(filters, dedupe_memory=512, dedupe_approximate=False):
+    """URLFilter for the filter options a coordinator stored in its queue"""
+    return build_url_filter(argparse.Namespace(**{name: filters.get(name) for name in FILTER_OPTIONS},
+                                               dedupe_memory=dedupe_memory, dedupe_approximate=dedupe_approximate))
+
+# Options that shape which rows the archives send back; a resumed job must harvest with the same ones
+JOB_OPTIONS = ('extensions', 'exclude_extensions', 'include', 'exclude', 'start_date', 'end_date',
+               'cc_indexes', 'no_pushdown')
+
+def restore_options(parser, args, stored, names, what):
+    """Take each option left at its default from stored; exit with an error if one is set to a different value"""
+    conflicts = [f"--{name.replace('_', '-')}" for name in names
+                 if name in stored and getattr(args, name) != parser.get_default(name)
+                 and getattr(args, name) != stored[name]]
+    if conflicts:
+        parser.error(f"{what} was created with other options ({', '.join(conflicts)}); "
+                     f"start a new one to use different ones")
+    for name in names:
+        if name in stored:
+            setattr(args, name, stored[name])
+
+def print_queue_counts(queue):
+    counts = queue.counts()
+    print(f"[Queue] {counts['done']} done, {counts['leased']} leased, {counts['pending']} pending, "
+          f"{counts['failed']} failed")
+
+async def run_coordinate(argv):
+    """coordinate subcommand: expand domains into work units in a shared queue for workers to lease"""
+    from core.workqueue import WorkQueue
+
+    parser = argparse.ArgumentParser(prog='pybackurls.py coordinate',
+                                     description="Split domains into work units in a shared SQLite queue")
+    parser.add_argument('queue', help='Queue file, on storage every worker can reach')
+    parser.add_argument('domains', nargs='*', help='Target domains (default: read from stdin)')
+    parser.add_argument('--include-subs', action='store_true', help='Include subdomains')
+    parser.add_argument('--sources', default=','.join(SOURCES), help='Comma-separated sources to harvest')
+    parser.add_argument('--retry-failed', action='store_true', help='Queue units that ran out of attempts again')
+    parser.add_argument('--status', action='store_true', help='Only print how far the queue has got')
+    add_filter_arguments(parser)
+    add_harvest_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with WorkQueue(args.queue) as queue:
+        if args.status:
+            print_queue_counts(queue)
+            return
+        sources = [source.strip() for source in args.sources.split(',') if source.strip()]
+        unknown = set(sources) - set(SOURCES)
+        if unknown:
+            parser.error(f"Unknown sources: {', '.join(sorted(unknown))}")
+        # Workers filter with the options stored in the queue, and queued units carry them in their CDX
+        # queries, so the filters are fixed by the first run; later runs inherit them and may not change them
+        filters = queue.meta().get('filters')
+        if filters is None:
+            filters = {name: getattr(args, name) for name in FILTER_OPTIONS}
+            queue.set_meta(filters=filters)
+        else:
+            restore_options(parser, args, filters, FILTER_OPTIONS, 'this queue')
+        url_filter = filter_from_options(filters)
+        if args.retry_failed:
+            print(f"[Queue] {queue.retry_failed()} failed units queued again")
+        domains = args.domains or ([] if args.retry_failed else [line.strip() for line in sys.stdin if line.strip()])
+
+        cache = build_cache(args)
+        rate_limiter = RateLimiter(rate=args.host_rate, max_concurrency=args.host_concurrency)
+        async with build_harvester(args, cache=cache, rate_limiter=rate_limiter) as harvester:
+            window = asyncio.Semaphore(args.domain_concurrency)
+
+            async def plan(domain):
+                async with window:
+                    return await harvester.plan_units(domain, args.include_subs, sources,
+                                                      start=url_filter.start_date, end=url_filter.end_date,
+                                                      filters=url_filter.cdx_filters())
+
+            for domain, units in zip(domains, await asyncio.gather(*(plan(domain) for domain in domains))):
+                print(f"[Queue] {domain}: {queue.add(units)} new units of {len(units)}")
+        if cache:
+            cache.close()
+        print_queue_counts(queue)
+
+async def run_work(argv):
+    """work subcommand: lease units from a shared queue until it is drained, writing rows to a shard"""
+    import socket
+    from core.workqueue import DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, SHARD_SUFFIX, QueueWorker, WorkQueue
+
+    parser = argparse.ArgumentParser(prog='pybackurls.py work',
+                                     description="Fetch and filter work units leased from a shared queue")
+    parser.add_argument('queue', help='Queue file written by coordinate')
+    parser.add_argument('--output-dir', required=True, help='Directory for shard files, shared with the merge step')
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}",
+                        help='Name of this worker and its shard (default: host-pid)')
+    parser.add_argument('--units', type=int, default=4, help='Units worked on at once (default 4)')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE,
+                        help=f'Seconds a leased unit stays reserved without renewal (default {DEFAULT_LEASE:g})')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Leases a unit gets before it is marked failed (default {DEFAULT_MAX_ATTEMPTS})')
+    add_dedupe_arguments(parser)
+    add_harvest_arguments(parser)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    shard_path = os.path.join(args.output_dir, args.worker_id + SHARD_SUFFIX)
+    with WorkQueue(args.queue) as queue:
+        url_filter = filter_from_options(queue.meta().get('filters', {}), args.dedupe_memory, args.dedupe_approximate)
+        cache = build_cache(args)
+        rate_limiter = RateLimiter(rate=args.host_rate, max_concurrency=args.host_concurrency)
+        async with build_harvester(args, cache=cache, rate_limiter=rate_limiter) as harvester:
+            worker = QueueWorker(queue, harvester, url_filter, shard_path, args.worker_id, concurrency=args.units,
+                                 lease_seconds=args.lease, max_attempts=args.max_attempts)
+            await worker.run()
+        if cache:
+            cache.close()
+        print(f"[Worker] {args.worker_id}: {worker.units} units, {worker.rows} rows to {shard_path}, "
+              f"{worker.failed} failed attempts")
+        print_queue_counts(queue)
+
+def run_merge(argv):
+    """merge subcommand: dedupe every worker shard into the final result file"""
+    from core.workqueue import merge_shards, shard_paths
+
+    parser = argparse.ArgumentParser(prog='pybackurls.py merge',
+                                     description="Merge and dedupe the shards written by workers")
+    parser.add_argument('shard_dir', help='Directory the workers wrote their shards to')
+    parser.add_argument('--format', choices=['txt', 'json', 'jsonl', 'csv', 'html', 'store'], default='txt')
+    parser.add_argument('--output', '-o', help='Output filename')
+    parser.add_argument('--compress', choices=COMPRESSIONS, help='Compress output files (zstd needs the zstandard package)')
+    parser.add_argument('--shard-size', type=int, help='Rotate output into a new file every N MB (uncompressed)')
+    add_dedupe_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.compress == 'zstd' and not zstd_available():
+        parser.error("zstd compression requires the 'zstandard' package (pip install zstandard)")
+    paths = shard_paths(args.shard_dir)
+    if not paths:
+        print(f"[Merge] No shards found in {args.shard_dir}")
+        return
+    filename = resolve_output_filename(args)
+    exporter = URLExporter(compress=args.compress,
+                           shard_size=args.shard_size * 1024 * 1024 if args.shard_size else None)
+    # Shards were filtered by the workers; only cross-worker duplicates remain
+    seen = URLFilter(dedupe_memory=args.dedupe_memory * 1024 * 1024,
+                     dedupe_approximate=args.dedupe_approximate).new_deduplicator()
+    with exporter.open_stream(args.format, filename) as writer:
+        count = merge_shards(paths, writer, seen)
+    target = writer.paths[0] if len(writer.paths) == 1 else f"{len(writer.paths)} files ({writer.paths[0]} ...)"
+    print(f"[Merge] {count} unique URLs from {len(paths)} shards to {target}")
+
+async def main():
+    if sys.argv[1:2] == ['coordinate']:
+        await run_coordinate(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['work']:
+        await run_work(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['merge']:
+        run_merge(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['query']:
+        run_query(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['serve']:
+        await run_serve(sys.argv[2:])
+        return
+
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Pybackurls - Python Wayback and Recon URL Extractor")
+    parser.add_argument('domains', nargs='*', help='Target domains')
+    parser.add_argument('--include-subs', action='store_true', help='Include subdomains')
+    parser.add_argument('--format', choices=['txt', 'json', 'jsonl', 'csv', 'html', 'store'], default='txt')
+    parser.add_argument('--output', '-o', help='Output filename')
+    add_harvest_arguments(parser)
+    parser.add_argument('--since-last-run', action='store_true',
+                        help='Only report URLs archived since the previous run recorded in the state file')
+    parser.add_argument('--state-file', default=os.path.join(DEFAULT_CACHE_DIR, 'state.json'),
+                        help='State file used by --since-last-run')
+    add_filter_arguments(parser)
     parser.add_argument('--analyze', action='store_true', help='Perform URL analysis')
     parser.add_argument('--interactive', action='store_true', help='Interactive mode')
     parser.add_argument('--show-stats', action='store_true', help='Show statistics')
+    parser.add_argument('--workers', type=int, help='Processes used to analyze large result sets (default: CPU count)')
+    parser.add_argument('--rules', action='append', default=[],
+                        help='JSON file of extra recon highlight rules {"Category": ["regex", ...]} (repeatable)')
+    add_dedupe_arguments(parser)
+    parser.add_argument('--cluster', action='store_true',
+                        help='Collapse URLs that differ only in IDs and parameter values into templates')
+    parser.add_argument('--cluster-keep', type=int, default=1,
+                        help='Representative URLs kept per template with --cluster (default 1)')
+    parser.add_argument('--cluster-fanout', type=int, default=50,
+                        help='Distinct path segments at one level before --cluster treats them as a wildcard (default 50)')
+    parser.add_argument('--cluster-report',
+                        help='Per-template counts and representatives as JSON lines (default: next to the results file)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream results through the filters to the output file as they arrive')
+    parser.add_argument('--compress', choices=COMPRESSIONS, help='Compress output files (zstd needs the zstandard package)')
+    parser.add_argument('--shard-size', type=int, help='Rotate output into a new file every N MB (uncompressed)')
+    parser.add_argument('--job-dir', help='Checkpoint finished pages and their rows to this directory')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the job in --job-dir, skipping the pages it already finished')
+    parser.add_argument('--metrics', help='Write run metrics (latency, bytes, stage rates, retries, cache, RSS) as JSON')
+    parser.add_argument('--prometheus', help='Also write the metrics in Prometheus text format')
+    parser.add_argument('--profile', choices=PROFILE_MODES, help='Profile the run with cProfile or tracemalloc')
+    parser.add_argument('--profile-output', help='Profile dump path (default: next to the results file)')
+    parser.add_argument('--pipe', action='store_true',
+                        help='Headless: stream deduplicated URLs to stdout, no banner, progress or results file')
     args = parser.parse_args()
 
+    if args.pipe:
+        unsupported = [flag for flag, value in (('--output', args.output), ('--analyze', args.analyze),
+                                                ('--show-stats', args.show_stats), ('--interactive', args.interactive),
+                                                ('--job-dir', args.job_dir), ('--profile', args.profile))
+                       if value]
+        if unsupported:
+            parser.error(f"--pipe writes plain URLs to stdout and cannot be combined with {', '.join(unsupported)}")
+        await run_pipe(args)
+        return
+
+    from core.analyzer import URLAnalyzer, URLStats
+    from core.utils import DisplayManager
+
     # Initialize components
     # Clear the screen before running the app
     os.system('cls' if os.name == 'nt' else 'clear')
     display = DisplayManager()
     display.show_banner()
 
+    if args.compress == 'zstd' and not zstd_available():
+        display.console.print("zstd compression requires the 'zstandard' package (pip install zstandard)", style="red")
+        return
+
+    if args.resume and not args.job_dir:
+        display.console.print("--resume needs the --job-dir of the job to continue.", style="red")
+        return
+    journal = None
+    if args.job_dir:
+        try:
+            journal = HarvestJournal(args.job_dir, resume=args.resume)
+        except ValueError as e:
+            display.console.print(str(e), style="red")
+            return
+        if args.resume:
+            # The job's scope comes from the journal unless it is given again
+            args.include_subs = args.include_subs or journal.meta.get('include_subs', False)
+            restore_options(parser, args, journal.meta, JOB_OPTIONS, f"the job in {args.job_dir}")
+            display.console.print(f"[*] Resuming job with {len(journal.completed)} finished pages", style="green")
+
     # Handle input
-    domains = args.domains if args.domains else [line.strip() for line in sys.stdin if line.strip()]
+    if args.domains:
+        domains = args.domains
+    elif journal and journal.meta.get('domains'):
+        domains = journal.meta['domains']
+    else:
+        domains = [line.strip() for line in sys.stdin if line.strip()]
     if not domains:
         display.console.print("No domains provided.", style="red")
         return
+    if journal:
+        journal.save_meta(domains=domains, include_subs=args.include_subs,
+                          **{name: getattr(args, name) for name in JOB_OPTIONS})
+
+    # --- SMART FILTERING & CLEANING OPTIONS ---
+    url_filter = build_url_filter(args)
+
+    analyzer = URLAnalyzer(rules_files=args.rules)
+    exporter = URLExporter(display, compress=args.compress,
+                           shard_size=args.shard_size * 1024 * 1024 if args.shard_size else None)
+    filename = resolve_output_filename(args)
+
+    clusterer = build_clusterer(args, analyzer)
+    cluster_report = args.cluster_report or os.path.splitext(filename)[0] + '.clusters.jsonl'
+
+    metrics = MetricsRegistry()
+    profiler = None
+    if args.profile:
+        default_dump = os.path.splitext(filename)[0] + ('.prof' if args.profile == 'cprofile' else '.tracemalloc.txt')
+        profiler = RunProfiler(args.profile, args.profile_output or default_dump)
+        profiler.start()
 
     # Main harvesting logic
-    all_results = []
-    async with URLHarvester(max_concurrent=args.threads) as harvester:
+    cache = build_cache(args)
+    state = HarvestState(args.state_file) if args.since_last_run else None
+    rate_limiter = RateLimiter(rate=args.host_rate, max_concurrency=args.host_concurrency)
+    async with build_harvester(args, cache=cache, rate_limiter=rate_limiter, journal=journal,
+                               metrics=metrics) as harvester:
+        scheduler = HarvestScheduler(harvester, max_domains=args.domain_concurrency,
+                                     include_subs=args.include_subs, state=state,
+                                     start=url_filter.start_date, end=url_filter.end_date,
+                                     cdx_filters=url_filter.cdx_filters())
         with display.create_progress_bar() as progress:
-            for domain in domains:
-                task = progress.add_task(f"Harvesting {domain}...", total=100)
-                wayback_task = harvester.fetch_wayback_urls(domain, args.include_subs)
-                cc_task = harvester.fetch_commoncrawl_urls(domain, args.include_subs)
-                vt_task = harvester.fetch_virustotal_urls(domain)
-                progress.update(task, advance=33)
-                wayback_results = await wayback_task
-                progress.update(task, advance=33)
-                cc_results = await cc_task
-                progress.update(task, advance=34)
-                vt_results = await vt_task
-                domain_results = wayback_results + cc_results + vt_results
-                all_results.extend(domain_results)
-                progress.update(task, completed=True)
-
-    # --- SMART FILTERING & CLEANING ---
-    filter_ext = args.extensions.split(',') if args.extensions else None
-    exclude_ext = args.exclude_extensions.split(',') if args.exclude_extensions else None
-    filter_patterns = args.include.split(',') if args.include else None
-    exclude_patterns = args.exclude.split(',') if args.exclude else None
-
-    all_results = clean_and_filter_urls(
-        all_results,
-        min_length=args.minlen,
-        filter_ext=filter_ext,
-        filter_patterns=filter_patterns,
-        exclude_patterns=exclude_patterns
-    )
+            source_tasks = {
+                source: progress.add_task(f"Harvesting {source}...", total=len(domains))
+                for source in scheduler.sources
+            }
 
-    if exclude_ext:
-        # Remove URLs with specified extensions
-        all_results = [res for res in all_results if not any(res.url.lower().endswith(f".{ext}") for ext in exclude_ext)]
+            def on_source_done(domain, source, count):
+                progress.update(source_tasks[source], advance=1)
 
-    # Deduplicate (by URL only)
-    url_filter = URLFilter()
-    all_results = url_filter.deduplicate_urls(all_results)
+            if args.stream:
+                # Statistics are accumulated on the fly and written when the writer closes
+                stream_stats = URLStats() if args.analyze or args.show_stats else None
+                with exporter.open_stream(args.format, filename) as writer:
+                    results = scheduler.stream(domains, on_source_done=on_source_done)
+                    if journal:
+                        results = replay_then(journal.replay(), results)
+                    recon_highlights = await stream_results(results, url_filter, writer, analyzer, stats=stream_stats,
+                                                            metrics=metrics, clusterer=clusterer)
+                    if stream_stats is not None and args.analyze:
+                        writer.set_statistics(stream_stats.as_dict())
+                total_urls = writer.count
+            else:
+                with metrics.stage('harvest') as stage:
+                    all_results = await scheduler.collect(domains, on_source_done=on_source_done)
+                    stage['rows'] = len(all_results)
+                if journal:
+                    replayed = URLBatch(journal.replay())
+                    if replayed:
+                        replayed.extend(all_results)
+                        all_results = replayed
 
-    # --- RECON HIGHLIGHTS ---
-    analyzer = URLAnalyzer()
-    recon_highlights = analyzer.find_recon_highlights(all_results)
-    if recon_highlights:
-        print("\nRecon Highlights")
-        print("-" * 60)
-        for item in recon_highlights:
-            print(f"{item['type']}: {item['url']}")
-        print("-" * 60)
-    else:
-        print("\nNo recon highlights detected in this run.")
+    record_run_metrics(metrics, cache, rate_limiter)
+    if cache:
+        cache.close()
+    if journal:
+        journal.close()
+        if journal.replayed_rows:
+            display.console.print(f"[*] Restored {journal.replayed_rows} rows from earlier runs of this job",
+                                  style="green")
 
-    # --- ANALYSIS/STATS ---
-    if args.analyze or args.show_stats:
-        stats = analyzer.analyze_urls(all_results)
-        if args.show_stats:
-            display.show_stats_table(stats)
-        if args.analyze and stats.get('parameters_found'):
-            print("\nCommon GET parameters (Top 10):")
-            for k, v in stats['parameters_found'].items():
-                print(f"  {k}: {v}")
-
-    # --- EXPORT ---
-    exporter = URLExporter(display)
-    output_dir = "results"
-    Path(output_dir).mkdir(exist_ok=True)
-    if args.output:
-        # If user provided a filename, save inside the output directory if it's just a filename (no path)
-        if os.path.dirname(args.output):
-            # User provided full or relative path, respect it as-is
-            filename = args.output
-        else:
-            filename = os.path.join(output_dir, args.output)
-    else:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = os.path.join(output_dir, f"pybackurls_results_{timestamp}.{args.format}")
-
-    if args.format == 'json':
-        exporter.export_json(all_results, filename, include_stats=args.analyze)
-    elif args.format == 'csv':
-        exporter.export_csv(all_results, filename)
-    elif args.format == 'html':
-        stats = analyzer.analyze_urls(all_results) if args.analyze else None
-        exporter.export_html(all_results, filename, stats)
+    failed_pages = harvester.failed_pages
+    if failed_pages:
+        display.console.print(f"[!] {failed_pages} index pages still failed after retries; results are incomplete",
+                              style="yellow")
+    if args.show_stats:
+        for line in transport_report(metrics):
+            display.console.print(f"[*] {line}", style="cyan")
+
+    if args.stream:
+        print_recon_highlights(recon_highlights)
+        if stream_stats is not None:
+            show_stats(args, display, stream_stats.as_dict())
     else:
-        exporter.export_txt(all_results, filename)
+        # Clean, filter and deduplicate (by URL only) in one pass
+        with metrics.stage('filter') as stage:
+            stage['rows'] = len(all_results)
+            all_results = url_filter.filter_batch(all_results)
+
+        # --- CLUSTERING ---
+        # Every later stage then works on one row per template
+        if clusterer:
+            with metrics.stage('cluster') as stage:
+                stage['rows'] = len(all_results)
+                all_results = clusterer.cluster_batch(all_results)
+
+        # --- RECON HIGHLIGHTS ---
+        with metrics.stage('highlights') as stage:
+            stage['rows'] = len(all_results)
+            recon_highlights = analyzer.find_recon_highlights(all_results)
+        print_recon_highlights(recon_highlights)
+
+        # --- ANALYSIS/STATS ---
+        # Computed once and reused by the exporters
+        stats = None
+        if args.analyze or args.show_stats:
+            with metrics.stage('analyze') as stage:
+                stage['rows'] = len(all_results)
+                stats = analyzer.analyze_urls(all_results, workers=args.workers)
+            show_stats(args, display, stats)
 
-    display.console.print(f"\nHarvesting complete! Found {len(all_results)} unique URLs", style="bold green")
+        # --- EXPORT ---
+        with metrics.stage('export') as stage:
+            stage['rows'] = len(all_results)
+            if args.format == 'json':
+                exporter.export_json(all_results, filename, include_stats=args.analyze, stats=stats)
+            elif args.format == 'jsonl':
+                exporter.export_jsonl(all_results, filename)
+            elif args.format == 'store':
+                exporter.export_store(all_results, filename)
+            elif args.format == 'csv':
+                exporter.export_csv(all_results, filename)
+            elif args.format == 'html':
+                exporter.export_html(all_results, filename, stats if args.analyze else None)
+            else:
+                exporter.export_txt(all_results, filename)
+        total_urls = len(all_results)
+
+    if clusterer:
+        report_clusters(clusterer, cluster_report)
+
+    # Only advance the incremental state once the delta has been written out, and never past missing pages
+    if state and not failed_pages:
+        state.save()
+
+    display.console.print(f"\nHarvesting complete! Found {total_urls} unique URLs", style="bold green")
     print("\n")
     display.console.print(f"Results saved to: [bold]{filename}[/bold]", style="green")
 
+    metrics.finish()
+    if args.metrics:
+        metrics.write_json(args.metrics)
+        display.console.print(f"Metrics saved to: [bold]{args.metrics}[/bold]", style="green")
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+    if profiler:
+        display.console.print(f"Profile saved to: [bold]{profiler.stop()}[/bold]", style="green")
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\nInterrupted by user")
+        if '--job-dir' in sys.argv:
+            print("Finished pages are checkpointed; rerun with --resume to continue")